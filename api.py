@@ -1,11 +1,37 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, ValidationError
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import asyncio
+import hashlib
+import math
+import base64
+import csv
+import io
 import json
-from database import DatabaseManager
+import logging
+import os
+from urllib.parse import parse_qsl
+import zlib
+from dotenv import load_dotenv
+from database import DIMENSIONS_VISITEURS, BaseVerrouilleeError, DatabaseManager
 from backup_manager import BackupManager
+from ingestion import IngestionQueue
+from spool import SpoolWriter
+from dedup import DedupIndex
+from async_database import AsyncDatabaseManager
+from cache import ResultCache
+from ratelimit import TokenBucketLimiter
+from live import LiveBroadcaster
+
+# Charger les variables d'environnement
+load_dotenv()
+
+logger = logging.getLogger(__name__)
 
 # Initialisation de l'API
 app = FastAPI(
@@ -13,7 +39,189 @@ app = FastAPI(
     description="API REST pour collecter les données de fréquentation et profils visiteurs",
 )
 
-# Configuration CORS pour permettre les appels depuis un site web
+# Initialisation des gestionnaires
+DB_THREADS = int(os.getenv("DB_THREADS", "8"))
+
+# Cache des lectures : CACHE_MAX_ENTRIES=0 le désactive
+result_cache = None
+if int(os.getenv("CACHE_MAX_ENTRIES", "1024")) > 0:
+    result_cache = ResultCache(
+        max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+        ttl=float(os.getenv("CACHE_TTL", "60")),
+    )
+
+db = DatabaseManager(
+    pool_size=DB_THREADS,
+    cache=result_cache,
+    shards_vues_totales=int(os.getenv("VUES_TOTALES_SHARDS", "8")),
+    delai_verrou=float(os.getenv("DB_LOCK_DEADLINE", "10")),
+    ecrivain_unique=os.getenv("DB_SINGLE_WRITER", "true").lower() in ("1", "true"),
+    intervalle_versions=float(os.getenv("CACHE_VERSIONS_S", "1")),
+)
+backup_manager = BackupManager()
+
+# Les handlers passent par adb : les appels SQLite bloquants s'exécutent dans
+# un pool de threads dédié au lieu de bloquer la boucle d'événements
+adb = AsyncDatabaseManager(db, max_workers=DB_THREADS)
+
+# File d'ingestion optionnelle : INGESTION_MODE=queue active l'écriture différée.
+# Les événements sont alors confirmés avant d'être écrits ; au plus
+# INGESTION_FLUSH_MS millisecondes (ou INGESTION_BATCH_SIZE événements) sont
+# perdus en cas d'arrêt brutal du processus.
+#
+# INGESTION_MODE=spool (plusieurs nœuds) : les événements sont ajoutés à des
+# segments locaux dans SPOOL_DIR, appliqués à la base par `python spool.py`.
+ingestion_queue = None
+ingestion_spool = None
+if os.getenv("INGESTION_MODE", "direct") == "queue":
+    ingestion_queue = IngestionQueue(
+        db,
+        batch_size=int(os.getenv("INGESTION_BATCH_SIZE", "500")),
+        flush_interval_ms=int(os.getenv("INGESTION_FLUSH_MS", "200")),
+        max_size=int(os.getenv("INGESTION_MAX_QUEUE", "100000")),
+        max_tentatives=int(os.getenv("INGESTION_MAX_RETRIES", "5")),
+    )
+elif os.getenv("INGESTION_MODE", "direct") == "spool":
+    ingestion_spool = SpoolWriter(
+        os.getenv("SPOOL_DIR", "spool"),
+        noeud=os.getenv("SPOOL_NODE_ID") or None,
+        flush_interval_ms=int(os.getenv("INGESTION_FLUSH_MS", "200")),
+        segment_max_bytes=int(os.getenv("SPOOL_SEGMENT_MAX_BYTES", "16777216")),
+        segment_max_s=float(os.getenv("SPOOL_SEGMENT_MAX_S", "60")),
+    )
+    ingestion_queue = ingestion_spool
+
+# Déduplication des lots et événements rejoués sur /tracking/bulk
+dedup_index = DedupIndex(
+    db,
+    taille_lru=int(os.getenv("DEDUP_LRU_SIZE", "100000")),
+    capacite_bloom=int(os.getenv("DEDUP_BLOOM_CAPACITY", "1000000")),
+    fenetre_s=float(os.getenv("DEDUP_WINDOW_S", "3600")),
+    retention_jours=int(os.getenv("DEDUP_RETENTION_DAYS", "7")),
+)
+
+
+# Flux en direct (/live) : un seul calcul par seconde partagé par les abonnés
+live_broadcaster = LiveBroadcaster(
+    adb,
+    intervalle=float(os.getenv("LIVE_INTERVAL_S", "1")),
+    max_abonnes=int(os.getenv("LIVE_MAX_SUBSCRIBERS", "1000")),
+)
+
+# Limitation de débit par client (clé X-API-Key, sinon adresse IP) avec des
+# budgets séparés pour l'ingestion et pour les lectures analytiques ; un débit
+# de 0 désactive la limite. En surcharge (file d'écriture ou latence de la
+# base au-delà des seuils), les lectures coûteuses sont refusées en 503 pour
+# laisser passer l'ingestion.
+ROUTES_INGESTION = {
+    ("POST", "/visiteur"),
+    ("POST", "/page-vue"),
+    ("POST", "/vue-totale"),
+    ("POST", "/tracking/bulk"),
+    ("POST", "/beacon"),
+    ("GET", "/p.gif"),
+}
+ROUTES_ANALYSE = {
+    "/stats",
+    "/stats/crosstab",
+    "/timeseries",
+    "/visiteurs",
+    "/pages",
+    "/export/visiteurs",
+    "/export/pages",
+}
+# Lectures en temps constant, servies même en surcharge
+ROUTES_ANALYSE_LEGERES = {"/stats"}
+
+# Limitation de débit désactivée par défaut : les clients sont identifiés par
+# X-API-Key ou par IP, et derrière un proxy toutes les requêtes partagent l'IP
+# du proxy tant que RATE_LIMIT_PROXY_HOPS (ou uvicorn --proxy-headers) n'est
+# pas configuré
+limiteurs = {}
+for _categorie, _prefixe in (
+    ("ingestion", "RATE_LIMIT_INGESTION"),
+    ("analyse", "RATE_LIMIT_ANALYSE"),
+):
+    _debit = float(os.getenv(f"{_prefixe}_RPS") or 0)
+    if _debit > 0:
+        limiteurs[_categorie] = TokenBucketLimiter(
+            _debit, float(os.getenv(f"{_prefixe}_BURST") or max(1.0, 4 * _debit))
+        )
+# Nombre de proxys de confiance devant l'API : l'IP du client est alors la
+# N-ième adresse en partant de la fin de X-Forwarded-For (les précédentes
+# peuvent être forgées par le client)
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+SHED_WRITE_BACKLOG = int(os.getenv("SHED_WRITE_BACKLOG", "1000"))
+SHED_DB_LATENCY_MS = float(os.getenv("SHED_DB_LATENCY_MS", "500"))
+stats_delestage = {"requetes_delestees": 0}
+
+
+def _cle_client(request):
+    cle_api = request.headers.get("x-api-key")
+    if cle_api:
+        return f"cle:{cle_api}"
+    if RATE_LIMIT_PROXY_HOPS > 0:
+        adresses = [
+            adresse.strip()
+            for adresse in request.headers.get("x-forwarded-for", "").split(",")
+            if adresse.strip()
+        ]
+        if adresses:
+            return f"ip:{adresses[-min(RATE_LIMIT_PROXY_HOPS, len(adresses))]}"
+    return f"ip:{request.client.host if request.client else 'inconnu'}"
+
+
+def _surcharge():
+    """Raison de la surcharge de la base, ou None"""
+    en_attente = 0
+    if db.ecrivain is not None:
+        statistiques = db.ecrivain.get_stats()
+        en_attente += statistiques["en_attente"]
+        # La latence moyenne n'évolue qu'avec les transactions : elle ne compte
+        # que tant que des écritures attendent
+        if statistiques["en_attente"] and statistiques["latence_ms"] > SHED_DB_LATENCY_MS:
+            return "latence de la base"
+    if ingestion_queue is not None and ingestion_spool is None:
+        en_attente += ingestion_queue.get_stats()["en_attente"]
+    if en_attente > SHED_WRITE_BACKLOG:
+        return "file d'écriture"
+    return None
+
+
+@app.middleware("http")
+async def limiter_debit(request: Request, call_next):
+    chemin = request.url.path
+    if (request.method, chemin) in ROUTES_INGESTION:
+        categorie = "ingestion"
+    elif request.method == "GET" and chemin in ROUTES_ANALYSE:
+        categorie = "analyse"
+    else:
+        return await call_next(request)
+
+    limiteur = limiteurs.get(categorie)
+    if limiteur is not None:
+        autorisee, attente = limiteur.autoriser(_cle_client(request))
+        if not autorisee:
+            return JSONResponse(
+                {"detail": f"Trop de requêtes ({categorie}), réessayez plus tard"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(attente)))},
+            )
+
+    if categorie == "analyse" and chemin not in ROUTES_ANALYSE_LEGERES:
+        raison = _surcharge()
+        if raison:
+            stats_delestage["requetes_delestees"] += 1
+            return JSONResponse(
+                {"detail": f"Service surchargé ({raison}), réessayez plus tard"},
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+    return await call_next(request)
+
+
+# Configuration CORS pour permettre les appels depuis un site web (ajoutée en
+# dernier pour envelopper aussi les réponses 429/503 ci-dessus)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # En production, spécifiez les domaines autorisés
@@ -22,9 +230,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialisation des gestionnaires
-db = DatabaseManager()
-backup_manager = BackupManager()
+@app.on_event("startup")
+def demarrer_ingestion():
+    if ingestion_queue:
+        ingestion_queue.start()
+
+
+@app.on_event("shutdown")
+def arreter_ingestion():
+    """Écrit les événements en attente avant l'arrêt du serveur"""
+    if ingestion_queue:
+        ingestion_queue.stop()
+    adb.shutdown()
 
 
 # Modèles Pydantic pour la validation des données
@@ -34,6 +251,9 @@ class VisiteurCreate(BaseModel):
     temps_sejour: str = Field(..., description="Temps de séjour")
     tranche_age: str = Field(..., description="Tranche d'âge")
     type_personna: str = Field(..., description="Centres d'intérêt")
+    date_visite: Optional[datetime] = Field(
+        None, description="Date de la visite pour un rattrapage (UTC par défaut)"
+    )
 
     class Config:
         json_schema_extra = {
@@ -51,13 +271,44 @@ class PageVue(BaseModel):
         ..., description="Nom de la page visitée", min_length=1, max_length=255
     )
     categorie: str = Field(..., description="Catégorie de la page")
+    count: int = Field(
+        1, ge=1, le=1_000_000, description="Nombre de vues (pré-agrégées)"
+    )
+    date_vue: Optional[datetime] = Field(
+        None, description="Date des vues pour un rattrapage (UTC par défaut)"
+    )
 
     class Config:
         json_schema_extra = {
-            "example": {"nom_page": "Randonnées GR20", "categorie": "Activités"}
+            "example": {
+                "nom_page": "Randonnées GR20",
+                "categorie": "Activités",
+                "count": 340,
+                "date_vue": "2024-07-14T10:00:00Z",
+            }
         }
 
 
+# Tolérance sur l'horloge des clients pour les dates envoyées
+AVANCE_HORLOGE_MAX = timedelta(minutes=5)
+
+
+def _horodatage(valeur):
+    """
+    Date envoyée par un client au format stocké (AAAA-MM-JJ HH:MM:SS, UTC)
+
+    Les dates sans fuseau sont considérées en UTC ; None reste None (date
+    d'enregistrement). Lève ValueError pour une date dans le futur.
+    """
+    if valeur is None:
+        return None
+    if valeur.tzinfo is not None:
+        valeur = valeur.astimezone(timezone.utc).replace(tzinfo=None)
+    if valeur > datetime.now(timezone.utc).replace(tzinfo=None) + AVANCE_HORLOGE_MAX:
+        raise ValueError("la date ne peut pas être dans le futur")
+    return valeur.strftime("%Y-%m-%d %H:%M:%S")
+
+
 class VisiteurResponse(BaseModel):
     id: int
     type_visiteur: str
@@ -82,6 +333,70 @@ class StatsResponse(BaseModel):
     derniere_activite: Optional[str]
 
 
+# Cache HTTP : les réponses de lecture portent la version des données (ETag)
+# et les requêtes conditionnelles reçoivent 304 tant qu'aucune écriture n'a eu lieu
+def _est_a_jour(request, etag, derniere_modification):
+    """Indique si la copie du client (If-None-Match / If-Modified-Since) est à jour"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [e.strip().removeprefix("W/") for e in if_none_match.split(",")]
+        return "*" in etags or etag in etags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and derniere_modification:
+        try:
+            return derniere_modification <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _reponse_conditionnelle(request, response, etag, derniere_modification=None):
+    """
+    Ajoute ETag / Last-Modified à la réponse.
+
+    Retourne une réponse 304 si le client possède déjà cette version, sinon None.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if derniere_modification:
+        headers["Last-Modified"] = format_datetime(derniere_modification, usegmt=True)
+    if _est_a_jour(request, etag, derniere_modification):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+async def _verifier_version(request, response):
+    """Réponse conditionnelle fondée sur la version courante des données"""
+    # Lue avant le corps de la réponse : celui-ci correspond à cette version
+    # ou à une plus récente, jamais à une plus ancienne
+    version, date_modification, generation = await adb.get_version_donnees()
+    derniere_modification = None
+    if date_modification:
+        derniere_modification = datetime.strptime(
+            date_modification, "%Y-%m-%d %H:%M:%S"
+        ).replace(tzinfo=timezone.utc)
+    return _reponse_conditionnelle(
+        request, response, f'"v{version}-{generation}"', derniere_modification
+    )
+
+
+def _erreur_serveur(message, e):
+    """
+    Erreur HTTP pour une exception de base de données
+
+    503 avec Retry-After si la base est restée verrouillée par un autre
+    écrivain (le client peut réessayer), 500 sinon.
+    """
+    if isinstance(e, BaseVerrouilleeError):
+        return HTTPException(
+            status_code=503,
+            detail=f"{message}: base de données occupée, réessayez plus tard",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return HTTPException(status_code=500, detail=f"{message}: {str(e)}")
+
+
 # Routes API
 
 
@@ -96,8 +411,12 @@ async def root():
             "POST /page-vue": "Enregistrer une vue de page",
             "POST /vue-totale": "Incrémenter les vues totales",
             "GET /stats": "Obtenir les statistiques",
+            "GET /stats/crosstab": "Tableau croisé de deux dimensions des visiteurs",
+            "GET /timeseries": "Séries temporelles des visiteurs et des vues",
             "GET /visiteurs": "Lister tous les visiteurs",
             "GET /pages": "Lister toutes les pages",
+            "GET /export/visiteurs": "Exporter les visiteurs (CSV/NDJSON)",
+            "GET /export/pages": "Exporter les pages (CSV/NDJSON)",
         },
     }
 
@@ -111,21 +430,34 @@ async def ajouter_visiteur(visiteur: VisiteurCreate):
     Toutes les valeurs doivent correspondre aux options prédéfinies.
     """
     try:
-        db.add_visiteur(
-            visiteur.type_visiteur,
-            visiteur.temps_sejour,
-            visiteur.tranche_age,
-            visiteur.type_personna,
-        )
+        date_visite = _horodatage(visiteur.date_visite)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"date_visite: {str(e)}")
+    try:
+        if not (
+            ingestion_queue
+            and ingestion_queue.submit_visiteur(
+                visiteur.type_visiteur,
+                visiteur.temps_sejour,
+                visiteur.tranche_age,
+                visiteur.type_personna,
+                date_visite,
+            )
+        ):
+            await adb.add_visiteur(
+                visiteur.type_visiteur,
+                visiteur.temps_sejour,
+                visiteur.tranche_age,
+                visiteur.type_personna,
+                date_visite,
+            )
         return {
             "success": True,
             "message": "Visiteur ajouté avec succès",
             "data": visiteur.dict(),
         }
     except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Erreur lors de l'ajout du visiteur: {str(e)}"
-        )
+        raise _erreur_serveur("Erreur lors de l'ajout du visiteur", e)
 
 
 @app.post("/page-vue", response_model=dict, tags=["Pages"])
@@ -135,19 +467,28 @@ async def enregistrer_vue_page(page: PageVue):
 
     Comptabilise la visite d'une page du site web.
     Si la page existe déjà, incrémente son compteur.
+    `count` enregistre plusieurs vues pré-agrégées en un seul incrément et
+    `date_vue` les rattache à une date passée.
     """
     try:
-        db.add_vue_page(page.nom_page, page.categorie)
+        date_vue = _horodatage(page.date_vue)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"date_vue: {str(e)}")
+    try:
+        if not (
+            ingestion_queue
+            and ingestion_queue.submit_vue_page(
+                page.nom_page, page.categorie, page.count, date_vue
+            )
+        ):
+            await adb.add_vue_page(page.nom_page, page.categorie, page.count, date_vue)
         return {
             "success": True,
             "message": "Vue de page enregistrée avec succès",
             "data": page.dict(),
         }
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erreur lors de l'enregistrement de la vue: {str(e)}",
-        )
+        raise _erreur_serveur("Erreur lors de l'enregistrement de la vue", e)
 
 
 @app.post("/vue-totale", response_model=dict, tags=["Statistiques"])
@@ -156,60 +497,366 @@ async def incrementer_vues_totales():
     Incrémenter le compteur de vues totales du site
 
     À appeler à chaque visite sur le site principal.
+    En mode file d'attente, le total retourné n'inclut pas les vues en attente.
     """
     try:
-        db.increment_vues_totales()
-        vues_totales = db.get_vues_totales()
+        if not (ingestion_queue and ingestion_queue.submit_vue_totale()):
+            await adb.increment_vues_totales()
+        vues_totales = await adb.get_vues_totales()
         return {
             "success": True,
             "message": "Vue totale incrémentée",
             "vues_totales": vues_totales,
         }
     except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Erreur lors de l'incrémentation: {str(e)}"
-        )
+        raise _erreur_serveur("Erreur lors de l'incrémentation", e)
 
 
 @app.get("/stats", response_model=StatsResponse, tags=["Statistiques"])
-async def obtenir_statistiques():
+async def obtenir_statistiques(request: Request, response: Response):
     """
     Obtenir les statistiques générales du site
 
     Retourne un résumé des métriques principales.
     """
     try:
-        vues_totales = db.get_vues_totales()
-        visiteurs = db.get_visiteurs()
-        pages = db.get_vues_pages()
-
-        derniere_activite = None
-        if visiteurs:
-            derniere_activite = visiteurs[0][5]  # Date du visiteur le plus récent
-
-        return StatsResponse(
-            vues_totales=vues_totales,
-            nombre_visiteurs=len(visiteurs),
-            nombre_pages=len(pages),
-            derniere_activite=derniere_activite,
+        non_modifie = await _verifier_version(request, response)
+        if non_modifie:
+            return non_modifie
+        resume = await adb.get_resume_statistiques()
+        return StatsResponse(**resume)
+    except Exception as e:
+        raise _erreur_serveur("Erreur lors de la récupération des stats", e)
+
+
+@app.get("/stats/crosstab", tags=["Statistiques"])
+async def tableau_croise(
+    request: Request,
+    response: Response,
+    rows: str = Query(..., description="Dimension en lignes"),
+    cols: str = Query(..., description="Dimension en colonnes"),
+    date_debut: Optional[str] = Query(None, alias="from", description="AAAA-MM-JJ"),
+    date_fin: Optional[str] = Query(None, alias="to", description="AAAA-MM-JJ"),
+    pourcentages: bool = False,
+):
+    """
+    Tableau croisé de deux dimensions des visiteurs
+
+    Dimensions possibles : type_visiteur, temps_sejour, tranche_age,
+    type_personna. Les comptes sont lus dans le cube des visiteurs ;
+    `pourcentages=true` ajoute les pourcentages en ligne et en colonne.
+    """
+    for dimension in (rows, cols):
+        if dimension not in DIMENSIONS_VISITEURS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Dimension inconnue: {dimension} "
+                f"(valeurs possibles: {', '.join(DIMENSIONS_VISITEURS)})",
+            )
+    if rows == cols:
+        raise HTTPException(
+            status_code=400, detail="rows et cols doivent être différentes"
         )
+    # Le cube est journalier : les bornes sont ramenées au jour (UTC)
+    date_debut = _borne_date(date_debut, "from")
+    date_fin = _borne_date(date_fin, "to")
+
+    try:
+        non_modifie = await _verifier_version(request, response)
+        if non_modifie:
+            return non_modifie
+        cellules = await adb.get_cube_visiteurs((rows, cols), date_debut, date_fin)
     except Exception as e:
+        raise _erreur_serveur("Erreur lors du calcul du tableau croisé", e)
+
+    valeurs_lignes = sorted({ligne for ligne, _, _ in cellules})
+    valeurs_colonnes = sorted({colonne for _, colonne, _ in cellules})
+    index_lignes = {v: i for i, v in enumerate(valeurs_lignes)}
+    index_colonnes = {v: i for i, v in enumerate(valeurs_colonnes)}
+    comptes = [[0] * len(valeurs_colonnes) for _ in valeurs_lignes]
+    for ligne, colonne, nombre in cellules:
+        comptes[index_lignes[ligne]][index_colonnes[colonne]] = nombre
+
+    totaux_lignes = [sum(ligne) for ligne in comptes]
+    totaux_colonnes = [sum(colonne) for colonne in zip(*comptes)]
+    resultat = {
+        "lignes": rows,
+        "colonnes": cols,
+        "valeurs_lignes": valeurs_lignes,
+        "valeurs_colonnes": valeurs_colonnes,
+        "comptes": comptes,
+        "totaux_lignes": totaux_lignes,
+        "totaux_colonnes": totaux_colonnes,
+        "total": sum(totaux_lignes),
+    }
+    if pourcentages:
+        resultat["pourcentages_lignes"] = [
+            [round(100 * n / total, 2) if total else 0.0 for n in ligne]
+            for ligne, total in zip(comptes, totaux_lignes)
+        ]
+        resultat["pourcentages_colonnes"] = [
+            [
+                round(100 * n / total, 2) if total else 0.0
+                for n, total in zip(ligne, totaux_colonnes)
+            ]
+            for ligne in comptes
+        ]
+    return resultat
+
+
+# Séries temporelles
+
+GRANULARITES = ("heure", "jour", "semaine", "mois")
+# Période couverte par défaut quand `from` est absent
+NOMBRE_PERIODES_DEFAUT = {"heure": 48, "jour": 30, "semaine": 26, "mois": 12}
+MAX_PERIODES = 5000
+
+
+def _debut_periode(instant, granularite):
+    """Ramène un instant au début de sa période (même règle que le SQL)"""
+    if granularite == "heure":
+        return instant.replace(minute=0, second=0, microsecond=0)
+    jour = instant.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularite == "semaine":
+        return jour - timedelta(days=jour.weekday())
+    if granularite == "mois":
+        return jour.replace(day=1)
+    return jour
+
+
+def _periode_suivante(debut, granularite):
+    if granularite == "heure":
+        return debut + timedelta(hours=1)
+    if granularite == "semaine":
+        return debut + timedelta(weeks=1)
+    if granularite == "mois":
+        if debut.month == 12:
+            return debut.replace(year=debut.year + 1, month=1)
+        return debut.replace(month=debut.month + 1)
+    return debut + timedelta(days=1)
+
+
+def _periode_precedente(debut, granularite, nombre):
+    if granularite == "mois":
+        mois = debut.year * 12 + debut.month - 1 - nombre
+        return debut.replace(year=mois // 12, month=mois % 12 + 1)
+    pas = {"heure": timedelta(hours=1), "semaine": timedelta(weeks=1)}
+    return debut - pas.get(granularite, timedelta(days=1)) * nombre
+
+
+def _cle_periode(debut, granularite):
+    if granularite == "heure":
+        return debut.strftime("%Y-%m-%d %H:00:00")
+    return debut.strftime("%Y-%m-%d")
+
+
+def _lire_date(valeur, nom):
+    """
+    Borne de période envoyée par un client, en date naïve UTC
+
+    Comme pour _horodatage, une date avec fuseau (ex. suffixe Z) est convertie
+    en UTC ; une date sans fuseau est considérée en UTC. Une date illisible
+    donne une erreur 422.
+    """
+    try:
+        # fromisoformat n'accepte le suffixe Z qu'à partir de Python 3.11
+        date = datetime.fromisoformat(
+            valeur[:-1] + "+00:00" if valeur.endswith("Z") else valeur
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Date invalide pour {nom}: {valeur} (AAAA-MM-JJ[ HH:MM:SS])",
+        )
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def _borne_date(valeur, nom):
+    """
+    Borne de filtrage au format stocké (AAAA-MM-JJ[ HH:MM:SS], UTC), ou None
+
+    Une date seule reste une date seule : la base inclut alors toute la
+    journée pour la borne de fin.
+    """
+    if not valeur:
+        return None
+    date = _lire_date(valeur, nom)
+    if len(valeur) == 10:
+        return date.strftime("%Y-%m-%d")
+    return date.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _remplir_series(lignes, periodes, par_groupe):
+    """Répartit les lignes SQL en séries complétées par des zéros"""
+    index = {periode: i for i, periode in enumerate(periodes)}
+    series = {}
+    for ligne in lignes:
+        groupe = ligne[1] if par_groupe else "total"
+        serie = series.setdefault(groupe, [0] * len(periodes))
+        i = index.get(ligne[0])
+        if i is not None:
+            serie[i] += ligne[-1]
+    if not par_groupe and not series:
+        series["total"] = [0] * len(periodes)
+    return dict(sorted(series.items()))
+
+
+@app.get("/timeseries", tags=["Statistiques"])
+async def series_temporelles(
+    request: Request,
+    response: Response,
+    granularite: str = Query("jour", description="heure, jour, semaine ou mois"),
+    date_debut: Optional[str] = Query(
+        None, alias="from", description="AAAA-MM-JJ[ HH:MM:SS]"
+    ),
+    date_fin: Optional[str] = Query(
+        None, alias="to", description="AAAA-MM-JJ[ HH:MM:SS]"
+    ),
+    dimension: Optional[str] = Query(
+        None, description="categorie ou dimension des visiteurs"
+    ),
+):
+    """
+    Évolution des visiteurs et des vues de pages
+
+    Les valeurs sont regroupées par période côté base (agrégats journaliers,
+    horaires et cube des visiteurs) ; les périodes sans données valent 0.
+    Les semaines commencent le lundi. `dimension=categorie` découpe les vues
+    de pages par catégorie, une dimension des visiteurs découpe les visiteurs.
+    """
+    if granularite not in GRANULARITES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Granularité inconnue: {granularite} "
+            f"(valeurs possibles: {', '.join(GRANULARITES)})",
+        )
+    if dimension not in (None, "categorie", *DIMENSIONS_VISITEURS):
         raise HTTPException(
-            status_code=500,
-            detail=f"Erreur lors de la récupération des stats: {str(e)}",
+            status_code=400,
+            detail=f"Dimension inconnue: {dimension} (valeurs possibles: "
+            f"categorie, {', '.join(DIMENSIONS_VISITEURS)})",
+        )
+
+    if date_fin:
+        fin = _lire_date(date_fin, "to")
+        if len(date_fin) == 10:
+            # Date seule : inclure toute la journée
+            fin += timedelta(days=1, seconds=-1)
+    else:
+        fin = datetime.now(timezone.utc).replace(tzinfo=None)
+    derniere_periode = _debut_periode(fin, granularite)
+    if date_debut:
+        debut = _lire_date(date_debut, "from")
+    else:
+        debut = _periode_precedente(
+            derniere_periode, granularite, NOMBRE_PERIODES_DEFAUT[granularite] - 1
+        )
+    if debut > fin:
+        raise HTTPException(status_code=400, detail="from doit précéder to")
+
+    periodes = []
+    periode = _debut_periode(debut, granularite)
+    while periode <= derniere_periode:
+        if len(periodes) >= MAX_PERIODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Trop de périodes (maximum {MAX_PERIODES}), "
+                "réduisez l'intervalle ou augmentez la granularité",
+            )
+        periodes.append(_cle_periode(periode, granularite))
+        periode = _periode_suivante(periode, granularite)
+
+    # Bornes SQL alignées sur les périodes complètes
+    borne_debut = periodes[0]
+    borne_fin = fin.strftime("%Y-%m-%d %H:%M:%S")
+    dimension_visiteurs = dimension if dimension in DIMENSIONS_VISITEURS else None
+
+    try:
+        non_modifie = await _verifier_version(request, response)
+        if non_modifie:
+            return non_modifie
+        visiteurs = await adb.get_series_visiteurs(
+            granularite, borne_debut, borne_fin, dimension_visiteurs
+        )
+        vues_pages = await adb.get_series_vues_pages(
+            granularite,
+            date_debut=borne_debut,
+            date_fin=borne_fin,
+            grouper_par="categorie" if dimension == "categorie" else None,
         )
+    except Exception as e:
+        raise _erreur_serveur("Erreur lors du calcul des séries temporelles", e)
+
+    return {
+        "granularite": granularite,
+        "debut": periodes[0],
+        "fin": periodes[-1],
+        "dimension": dimension,
+        "periodes": periodes,
+        "visiteurs": _remplir_series(
+            visiteurs, periodes, dimension_visiteurs is not None
+        ),
+        "vues_pages": _remplir_series(vues_pages, periodes, dimension == "categorie"),
+    }
+
+
+def _encoder_curseur(visiteur):
+    """Curseur opaque à partir de (date_visite, id) du dernier visiteur"""
+    brut = json.dumps([visiteur[5], visiteur[0]]).encode()
+    return base64.urlsafe_b64encode(brut).decode()
+
+
+def _decoder_curseur(curseur):
+    try:
+        date_visite, visiteur_id = json.loads(base64.urlsafe_b64decode(curseur))
+        return str(date_visite), int(visiteur_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
 
 
 @app.get("/visiteurs", response_model=List[VisiteurResponse], tags=["Visiteurs"])
-async def lister_visiteurs(limit: int = 100):
+async def lister_visiteurs(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    type_visiteur: Optional[str] = None,
+    temps_sejour: Optional[str] = None,
+    tranche_age: Optional[str] = None,
+    type_personna: Optional[str] = None,
+    date_debut: Optional[str] = Query(None, description="AAAA-MM-JJ[ HH:MM:SS]"),
+    date_fin: Optional[str] = Query(None, description="AAAA-MM-JJ[ HH:MM:SS]"),
+    curseur: Optional[str] = None,
+):
     """
-    Lister tous les visiteurs
+    Lister les visiteurs
 
-    Retourne la liste des visiteurs enregistrés (limité à 100 par défaut).
+    Retourne les visiteurs du plus récent au plus ancien (100 par défaut),
+    filtrés par catégorie et par période. Si d'autres visiteurs suivent,
+    l'en-tête X-Next-Cursor contient le curseur à passer dans `curseur`
+    pour obtenir la page suivante.
     """
+    apres = _decoder_curseur(curseur) if curseur else None
+    date_debut = _borne_date(date_debut, "date_debut")
+    date_fin = _borne_date(date_fin, "date_fin")
     try:
-        visiteurs = db.get_visiteurs()
-        visiteurs_limited = visiteurs[:limit]
+        non_modifie = await _verifier_version(request, response)
+        if non_modifie:
+            return non_modifie
+        visiteurs = await adb.get_visiteurs_page(
+            limit,
+            type_visiteur,
+            temps_sejour,
+            tranche_age,
+            type_personna,
+            date_debut,
+            date_fin,
+            apres,
+        )
+
+        if len(visiteurs) == limit:
+            response.headers["X-Next-Cursor"] = _encoder_curseur(visiteurs[-1])
 
         return [
             VisiteurResponse(
@@ -220,24 +867,24 @@ async def lister_visiteurs(limit: int = 100):
                 type_personna=v[4],
                 date_visite=v[5],
             )
-            for v in visiteurs_limited
+            for v in visiteurs
         ]
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erreur lors de la récupération des visiteurs: {str(e)}",
-        )
+        raise _erreur_serveur("Erreur lors de la récupération des visiteurs", e)
 
 
 @app.get("/pages", response_model=List[PageResponse], tags=["Pages"])
-async def lister_pages():
+async def lister_pages(request: Request, response: Response):
     """
     Lister toutes les pages avec leurs statistiques
 
     Retourne la liste des pages visitées avec le nombre de vues.
     """
     try:
-        pages = db.get_vues_pages_with_id()
+        non_modifie = await _verifier_version(request, response)
+        if non_modifie:
+            return non_modifie
+        pages = await adb.get_vues_pages_with_id()
 
         return [
             PageResponse(
@@ -250,10 +897,29 @@ async def lister_pages():
             for p in pages
         ]
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erreur lors de la récupération des pages: {str(e)}",
+        raise _erreur_serveur("Erreur lors de la récupération des pages", e)
+
+
+def _message_erreur(e):
+    """Résume une erreur de validation en une ligne"""
+    if isinstance(e, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(x) for x in err['loc'])}: {err['msg']}"
+            for err in e.errors()
         )
+    return str(e)
+
+
+def _identifiant(valeur):
+    """Identifiant de lot ou d'événement fourni par le client (None si absent)"""
+    if valeur is None:
+        return None
+    if isinstance(valeur, bool) or not isinstance(valeur, (str, int)):
+        raise ValueError("l'identifiant doit être une chaîne ou un entier")
+    valeur = str(valeur)
+    if not 1 <= len(valeur) <= 128:
+        raise ValueError("l'identifiant doit faire de 1 à 128 caractères")
+    return valeur
 
 
 # Routes pour le tracking avancé
@@ -264,55 +930,401 @@ async def tracking_bulk(request: Request):
 
     Permet d'envoyer plusieurs événements en une seule requête.
     Format JSON: {"visiteurs": [...], "pages": [...], "vues_totales": number}
+    Chaque page peut porter un `count` (vues pré-agrégées) et une `date_vue`,
+    chaque visiteur une `date_visite`, pour le rattrapage d'historique.
+
+    Le lot est validé en une passe puis enregistré dans une seule transaction
+    (ou ajouté au spool en une seule ligne avec INGESTION_MODE=spool).
+    Les éléments invalides sont ignorés et signalés dans "erreurs".
+
+    Un `batch_id` sur le lot et un `id` sur chaque élément rendent l'envoi
+    idempotent : un lot ou un élément déjà reçu est ignoré et signalé dans
+    "doublons" (index dans le lot envoyé). Les vues totales n'ont pas
+    d'identifiant : dans un lot idempotent, elles exigent un `batch_id`.
+    Avec INGESTION_MODE=spool, le lot idempotent passe aussi par le spool et
+    les rejeux non encore connus de l'API sont écartés au compactage.
     """
     try:
         data = await request.json()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"JSON invalide: {str(e)}")
 
-        added_visiteurs = 0
-        added_pages = 0
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Le lot doit être un objet JSON")
 
-        # Traiter les visiteurs
-        if "visiteurs" in data and isinstance(data["visiteurs"], list):
-            for visiteur_data in data["visiteurs"]:
-                try:
-                    visiteur = VisiteurCreate(**visiteur_data)
-                    db.add_visiteur(
+    visiteurs = []
+    pages = []
+    vues_totales = 0
+    erreurs = []
+    # Identifiant et index dans le lot envoyé de chaque élément valide
+    ids_visiteurs = []
+    ids_pages = []
+
+    try:
+        id_lot = _identifiant(data.get("batch_id"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"batch_id: {str(e)}")
+
+    # Valider les visiteurs
+    if isinstance(data.get("visiteurs"), list):
+        for index, visiteur_data in enumerate(data["visiteurs"]):
+            try:
+                visiteur = VisiteurCreate(**visiteur_data)
+                identifiant = _identifiant(visiteur_data.get("id"))
+                visiteurs.append(
+                    (
                         visiteur.type_visiteur,
                         visiteur.temps_sejour,
                         visiteur.tranche_age,
                         visiteur.type_personna,
+                        _horodatage(visiteur.date_visite),
                     )
-                    added_visiteurs += 1
-                except Exception as e:
-                    print(f"Erreur visiteur: {e}")
+                )
+                ids_visiteurs.append((identifiant, index))
+            except Exception as e:
+                erreurs.append(
+                    {"type": "visiteur", "index": index, "erreur": _message_erreur(e)}
+                )
 
-        # Traiter les vues de pages
-        if "pages" in data and isinstance(data["pages"], list):
-            for page_data in data["pages"]:
-                try:
-                    page = PageVue(**page_data)
-                    db.add_vue_page(page.nom_page, page.categorie)
-                    added_pages += 1
-                except Exception as e:
-                    print(f"Erreur page: {e}")
+    # Valider les vues de pages
+    if isinstance(data.get("pages"), list):
+        for index, page_data in enumerate(data["pages"]):
+            try:
+                page = PageVue(**page_data)
+                identifiant = _identifiant(page_data.get("id"))
+                pages.append(
+                    (
+                        page.nom_page,
+                        page.categorie,
+                        page.count,
+                        _horodatage(page.date_vue),
+                    )
+                )
+                ids_pages.append((identifiant, index))
+            except Exception as e:
+                erreurs.append(
+                    {"type": "page", "index": index, "erreur": _message_erreur(e)}
+                )
 
-        # Traiter les vues totales
-        if "vues_totales" in data and isinstance(data["vues_totales"], int):
-            for _ in range(data["vues_totales"]):
-                db.increment_vues_totales()
+    # Valider les vues totales
+    if "vues_totales" in data:
+        valeur = data["vues_totales"]
+        if isinstance(valeur, int) and not isinstance(valeur, bool) and valeur >= 0:
+            vues_totales = valeur
+        else:
+            erreurs.append(
+                {
+                    "type": "vues_totales",
+                    "index": None,
+                    "erreur": "vues_totales doit être un entier positif",
+                }
+            )
 
-        return {
-            "success": True,
-            "message": "Données en lot traitées",
-            "visiteurs_ajoutes": added_visiteurs,
-            "pages_ajoutees": added_pages,
-        }
+    idempotent = id_lot is not None or any(
+        identifiant is not None for identifiant, _ in ids_visiteurs + ids_pages
+    )
+    if idempotent and vues_totales and id_lot is None:
+        # Sans identifiant de lot, chaque rejeu compterait à nouveau les vues totales
+        raise HTTPException(
+            status_code=400,
+            detail="vues_totales exige un batch_id quand les éléments portent un id",
+        )
+
+    doublons = {"lot": False, "visiteurs": [], "pages": []}
+    try:
+        if idempotent:
+            # Les identifiants sont enregistrés dans la même transaction que
+            # les événements (directement ou par le compacteur du spool)
+            doublons = await adb.run(
+                dedup_index.ajouter_lot,
+                id_lot,
+                [(i, v) for (i, _), v in zip(ids_visiteurs, visiteurs)],
+                [(i, p) for (i, _), p in zip(ids_pages, pages)],
+                vues_totales,
+                spool=ingestion_spool,
+            )
+        elif not (
+            ingestion_spool
+            and ingestion_spool.submit_batch(visiteurs, pages, vues_totales)
+        ):
+            await adb.add_batch(visiteurs, pages, vues_totales)
+    except Exception as e:
+        raise _erreur_serveur("Erreur lors du traitement en lot", e)
+
+    pages_doublons = set(doublons["pages"])
+    return {
+        "success": True,
+        "message": "Données en lot traitées",
+        "visiteurs_ajoutes": len(visiteurs) - len(doublons["visiteurs"]),
+        "pages_ajoutees": len(pages) - len(pages_doublons),
+        "vues_pages_ajoutees": sum(
+            page[2] for i, page in enumerate(pages) if i not in pages_doublons
+        ),
+        "vues_totales_ajoutees": 0 if doublons["lot"] else vues_totales,
+        "erreurs": erreurs,
+        "doublons": {
+            "lot": doublons["lot"],
+            "visiteurs": [ids_visiteurs[i][1] for i in doublons["visiteurs"]],
+            "pages": [ids_pages[i][1] for i in doublons["pages"]],
+        },
+    }
+
+
+# Routes de beacon : navigator.sendBeacon (POST text/plain, sans preflight CORS)
+# et pixel GIF. Champs compacts au format d'une query string :
+#   p=page & c=catégorie [& n=nombre de vues de la page] [& t=vues totales]
+#   [& v=type_visiteur & s=temps_sejour & a=tranche_age & i=centres d'intérêt]
+# La réponse part immédiatement ; l'événement est écrit après l'envoi.
+BEACON_TAILLE_MAX = 4096
+PIXEL_GIF = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+stats_beacons = {"recus": 0, "invalides": 0}
+
+
+def _lire_beacon(texte):
+    """
+    Convertit les champs d'un beacon en (visiteurs, vues_pages, vues_totales)
+
+    Lève ValueError si un champ est invalide ou si le beacon est vide.
+    """
+    champs = dict(parse_qsl(texte, max_num_fields=16))
+    visiteurs = []
+    pages = []
+
+    def entier(cle):
+        valeur = champs.get(cle, "")
+        if not valeur:
+            return 0
+        if not valeur.isdigit() or int(valeur) > 1_000_000:
+            raise ValueError(f"{cle} doit être un entier entre 0 et 1000000")
+        return int(valeur)
 
+    if "p" in champs or "c" in champs:
+        nom_page, categorie = champs.get("p", ""), champs.get("c", "")
+        if not 1 <= len(nom_page) <= 255 or not 1 <= len(categorie) <= 255:
+            raise ValueError("p et c doivent faire de 1 à 255 caractères")
+        nombre = entier("n") if "n" in champs else 1
+        if nombre:
+            pages.append((nom_page, categorie, nombre, None))
+    profil = [champs.get(cle, "") for cle in ("v", "s", "a", "i")]
+    if any(profil):
+        if not all(1 <= len(valeur) <= 255 for valeur in profil):
+            raise ValueError("le profil visiteur demande v, s, a et i")
+        visiteurs.append((*profil, None))
+    vues_totales = entier("t")
+    if not (visiteurs or pages or vues_totales):
+        raise ValueError("beacon vide")
+    return visiteurs, pages, vues_totales
+
+
+async def _enregistrer_beacon(visiteurs, vues_pages, vues_totales):
+    """Écrit un beacon après l'envoi de la réponse (file, spool ou base)"""
+    try:
+        if not (
+            ingestion_queue
+            and ingestion_queue.submit_batch(visiteurs, vues_pages, vues_totales)
+        ):
+            await adb.add_batch(visiteurs, vues_pages, vues_totales)
     except Exception as e:
+        logger.error("Erreur lors de l'enregistrement d'un beacon: %s", e)
+
+
+def _accepter_beacon(texte):
+    """Tâche d'écriture d'un beacon valide, ou None (compté comme invalide)"""
+    stats_beacons["recus"] += 1
+    try:
+        evenement = _lire_beacon(texte)
+    except ValueError:
+        stats_beacons["invalides"] += 1
+        return None
+    return BackgroundTask(_enregistrer_beacon, *evenement)
+
+
+@app.post("/beacon", status_code=204, tags=["Tracking Avancé"])
+async def beacon(request: Request):
+    """
+    Beacon de tracking (navigator.sendBeacon)
+
+    Corps text/plain au format `p=Page&c=Catégorie&t=1`. Répond 204 sans
+    attendre l'écriture, 400 si le beacon est invalide.
+    """
+    corps = await request.body()
+    if len(corps) > BEACON_TAILLE_MAX:
+        raise HTTPException(status_code=413, detail="Beacon trop volumineux")
+    tache = _accepter_beacon(corps.decode("utf-8", errors="replace"))
+    if tache is None:
+        raise HTTPException(status_code=400, detail="Beacon invalide")
+    return Response(status_code=204, background=tache)
+
+
+@app.get("/p.gif", tags=["Tracking Avancé"])
+async def pixel(request: Request):
+    """
+    Pixel de tracking 1x1
+
+    Mêmes champs que /beacon dans la query string. Le GIF est toujours
+    renvoyé ; un pixel invalide est seulement compté dans /metrics.
+    """
+    tache = _accepter_beacon(request.url.query[:BEACON_TAILLE_MAX])
+    return Response(
+        content=PIXEL_GIF,
+        media_type="image/gif",
+        headers={"Cache-Control": "no-store, max-age=0"},
+        background=tache,
+    )
+
+
+# Flux en direct
+@app.get("/live", tags=["Statistiques"])
+async def flux_en_direct(request: Request):
+    """
+    Flux Server-Sent Events de l'activité
+
+    Un événement `delta` par seconde : nouveaux visiteurs (total et par
+    dimension), vues ajoutées par page et vues totales (ajoutées et cumul).
+    """
+    file = live_broadcaster.abonner()
+    if file is None:
         raise HTTPException(
-            status_code=500, detail=f"Erreur lors du traitement en lot: {str(e)}"
+            status_code=503,
+            detail="Trop d'abonnés au flux en direct",
+            headers={"Retry-After": "30"},
         )
 
+    async def evenements():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    delta = await asyncio.wait_for(file.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                donnees = json.dumps(delta, ensure_ascii=False)
+                yield f"event: delta\ndata: {donnees}\n\n"
+        finally:
+            live_broadcaster.desabonner(file)
+
+    return StreamingResponse(
+        evenements(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Routes d'export
+COLONNES_EXPORT_VISITEURS = [
+    "id",
+    "type_visiteur",
+    "temps_sejour",
+    "tranche_age",
+    "type_personna",
+    "date_visite",
+]
+COLONNES_EXPORT_PAGES = [
+    "id",
+    "nom_page",
+    "categorie",
+    "nombre_vues",
+    "date_derniere_vue",
+]
+
+
+def _flux_export(lots, colonnes, format_export, compression):
+    """Sérialise des lots de lignes en CSV ou NDJSON, compressés en gzip si demandé"""
+    compresseur = zlib.compressobj(wbits=31) if compression == "gzip" else None
+
+    def encoder(texte):
+        donnees = texte.encode("utf-8")
+        return compresseur.compress(donnees) if compresseur else donnees
+
+    if format_export == "csv":
+        tampon = io.StringIO()
+        csv.writer(tampon).writerow(colonnes)
+        yield encoder(tampon.getvalue())
+
+    for lot in lots:
+        if format_export == "csv":
+            tampon = io.StringIO()
+            csv.writer(tampon).writerows(lot)
+            morceau = tampon.getvalue()
+        else:
+            morceau = "".join(
+                json.dumps(dict(zip(colonnes, ligne)), ensure_ascii=False) + "\n"
+                for ligne in lot
+            )
+        donnees = encoder(morceau)
+        if donnees:
+            yield donnees
+
+    if compresseur:
+        yield compresseur.flush()
+
+
+def _reponse_export(lots, colonnes, nom, format_export, compression):
+    media_type = "text/csv" if format_export == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="{nom}.{format_export}"'}
+    if compression == "gzip":
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        _flux_export(lots, colonnes, format_export, compression),
+        media_type=f"{media_type}; charset=utf-8",
+        headers=headers,
+    )
+
+
+@app.get("/export/visiteurs", tags=["Export"])
+async def exporter_visiteurs(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    compression: Optional[str] = Query(None, pattern="^gzip$"),
+    type_visiteur: Optional[str] = None,
+    temps_sejour: Optional[str] = None,
+    tranche_age: Optional[str] = None,
+    type_personna: Optional[str] = None,
+    date_debut: Optional[str] = Query(None, description="AAAA-MM-JJ[ HH:MM:SS]"),
+    date_fin: Optional[str] = Query(None, description="AAAA-MM-JJ[ HH:MM:SS]"),
+):
+    """
+    Exporter les visiteurs
+
+    Diffuse les visiteurs filtrés en CSV ou NDJSON, lot par lot depuis la
+    base : la mémoire utilisée ne dépend pas de la taille de la table.
+    `compression=gzip` compresse le flux (Content-Encoding: gzip).
+    """
+    # Validées avant le début du flux : une erreur ne peut plus être renvoyée ensuite
+    date_debut = _borne_date(date_debut, "date_debut")
+    date_fin = _borne_date(date_fin, "date_fin")
+    lots = db.iter_visiteurs(
+        type_visiteur,
+        temps_sejour,
+        tranche_age,
+        type_personna,
+        date_debut,
+        date_fin,
+    )
+    return _reponse_export(
+        lots, COLONNES_EXPORT_VISITEURS, "visiteurs", format, compression
+    )
+
+
+@app.get("/export/pages", tags=["Export"])
+async def exporter_pages(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    compression: Optional[str] = Query(None, pattern="^gzip$"),
+    categorie: Optional[str] = None,
+    date_debut: Optional[str] = Query(None, description="AAAA-MM-JJ[ HH:MM:SS]"),
+    date_fin: Optional[str] = Query(None, description="AAAA-MM-JJ[ HH:MM:SS]"),
+):
+    """
+    Exporter les pages
+
+    Diffuse les pages (filtrées par catégorie et date de dernière vue) en CSV
+    ou NDJSON, lot par lot depuis la base.
+    """
+    date_debut = _borne_date(date_debut, "date_debut")
+    date_fin = _borne_date(date_fin, "date_fin")
+    lots = db.iter_vues_pages(categorie, date_debut, date_fin)
+    return _reponse_export(lots, COLONNES_EXPORT_PAGES, "pages", format, compression)
+
 
 @app.get("/health", tags=["System"])
 async def health_check():
@@ -323,7 +1335,7 @@ async def health_check():
     """
     try:
         # Test simple de la base de données
-        vues_totales = db.get_vues_totales()
+        vues_totales = await adb.get_vues_totales()
         return {
             "status": "healthy",
             "timestamp": datetime.now().isoformat(),
@@ -334,50 +1346,83 @@ async def health_check():
         raise HTTPException(status_code=503, detail=f"Service indisponible: {str(e)}")
 
 
+# Valeurs indicatives (fixes : l'ETag est calculé une seule fois)
+VALEURS_VALIDES = {
+    "note": "L'API accepte des valeurs libres (texte) pour tous les champs. Les listes ci-dessous sont indicatives.",
+    "type_visiteur": ["Couple", "Famille", "Solitaire"],
+    "temps_sejour": [
+        "Moins d'une semaine",
+        "1-2 semaines",
+        "Plus d'un mois",
+        "Plus de 3 mois",
+    ],
+    "tranche_age": [
+        "18-25 ans",
+        "26-35 ans",
+        "36-45 ans",
+        "46-55 ans",
+        "56-65 ans",
+        "Plus de 65 ans",
+    ],
+    "type_personna": [
+        "Culture/Patrimoine",
+        "Randonnée",
+        "Plage",
+        "Gastronomie",
+        "Sport",
+        "Détente",
+    ],
+    "categories_pages": [
+        "Accueil",
+        "Activités",
+        "Hébergement",
+        "Restauration",
+        "Culture",
+        "Nature",
+        "Événements",
+        "Pratique",
+    ],
+}
+_empreinte = hashlib.sha1(json.dumps(VALEURS_VALIDES, sort_keys=True).encode())
+ETAG_VALEURS_VALIDES = f'"{_empreinte.hexdigest()}"'
+
+
+@app.get("/metrics", tags=["System"])
+async def metriques():
+    """
+    Compteurs internes de l'API
+
+    Succès/échecs du cache de lectures, état de la file d'ingestion,
+    contention sur les écritures (réessais, échecs après le délai maximal),
+    limitation de débit et délestage.
+    """
+    return {
+        "cache": result_cache.get_stats() if result_cache else None,
+        "ingestion": ingestion_queue.get_stats() if ingestion_queue else None,
+        "deduplication": dedup_index.get_stats(),
+        "beacons": dict(stats_beacons),
+        "limitation": {
+            categorie: limiteur.get_stats() for categorie, limiteur in limiteurs.items()
+        },
+        "delestage": {**stats_delestage, "surcharge": _surcharge()},
+        "live": live_broadcaster.get_stats(),
+        "base": db.get_stats_verrous(),
+        "ecrivain": db.ecrivain.get_stats() if db.ecrivain else None,
+    }
+
+
 # Route pour obtenir la documentation des valeurs valides
 @app.get("/valeurs-valides", tags=["Documentation"])
-async def valeurs_valides():
+async def valeurs_valides(request: Request, response: Response):
     """
     Obtenir les valeurs valides pour chaque champ
 
     Retourne les listes des valeurs acceptées pour créer des formulaires dynamiques.
     """
-    return {
-        "note": "L'API accepte des valeurs libres (texte) pour tous les champs. Les listes ci-dessous sont indicatives.",
-        "type_visiteur": ["Couple", "Famille", "Solitaire"],
-        "temps_sejour": [
-            "Moins d'une semaine",
-            "1-2 semaines",
-            "Plus d'un mois",
-            "Plus de 3 mois",
-        ],
-        "tranche_age": [
-            "18-25 ans",
-            "26-35 ans",
-            "36-45 ans",
-            "46-55 ans",
-            "56-65 ans",
-            "Plus de 65 ans",
-        ],
-        "type_personna": [
-            "Culture/Patrimoine",
-            "Randonnée",
-            "Plage",
-            "Gastronomie",
-            "Sport",
-            "Détente",
-        ],
-        "categories_pages": [
-            "Accueil",
-            "Activités",
-            "Hébergement",
-            "Restauration",
-            "Culture",
-            "Nature",
-            "Événements",
-            "Pratique",
-        ],
-    }
+    non_modifie = _reponse_conditionnelle(request, response, ETAG_VALEURS_VALIDES)
+    if non_modifie:
+        return non_modifie
+    return VALEURS_VALIDES
 
 
 if __name__ == "__main__":
@@ -189,6 +189,22 @@ def init_backup():
 db = init_db()
 backup_manager = init_backup()
 
+
+def crosstab_visiteurs(lignes, colonnes, nom_lignes, nom_colonnes):
+    """Tableau croisé de deux dimensions des visiteurs, lu dans le cube"""
+    df = pd.DataFrame(
+        db.get_cube_visiteurs((lignes, colonnes)),
+        columns=[nom_lignes, nom_colonnes, "Nombre"],
+    )
+    return df.pivot_table(
+        index=nom_lignes,
+        columns=nom_colonnes,
+        values="Nombre",
+        aggfunc="sum",
+        fill_value=0,
+    )
+
+
 # CSS pour le style
 st.markdown(
     """
@@ -369,7 +385,9 @@ if page == "Vue d'ensemble":
         with col1:
             # Matrice Âge vs Type de visiteur (pertinente pour le tourisme)
             if len(visiteurs) > 5:
-                cross_age_type = pd.crosstab(df_visiteurs["Age"], df_visiteurs["Type"])
+                cross_age_type = crosstab_visiteurs(
+                    "tranche_age", "type_visiteur", "Age", "Type"
+                )
 
                 fig_matrix = px.imshow(
                     cross_age_type.values,
@@ -1144,32 +1162,24 @@ elif page == "Gestion des Pages":
         # Analyse temporelle réelle des pages
         st.subheader(" Analyse Temporelle des Pages")
 
-        # Créer une évolution basée sur les vraies données
+        # Évolution réelle : vues par jour lues dans les agrégats journaliers
         if len(vues_pages_with_id) > 0:
-            # Convertir les dates en format datetime pour l'analyse
             df_pages_temporal = pd.DataFrame(
                 vues_pages_with_id,
                 columns=["ID", "Page", "Catégorie", "Vues", "Dernière vue"],
             )
-            df_pages_temporal["Date"] = pd.to_datetime(
-                df_pages_temporal["Dernière vue"]
+            df_evolution = pd.DataFrame(
+                db.get_series_vues_pages("jour"), columns=["Date", "Vues"]
             )
-
-            # Grouper par date et sommer les vues
-            df_evolution = (
-                df_pages_temporal.groupby(df_pages_temporal["Date"].dt.date)["Vues"]
-                .sum()
-                .reset_index()
-            )
-            df_evolution.columns = ["Date", "Vues_Cumulées"]
+            df_evolution["Date"] = pd.to_datetime(df_evolution["Date"])
 
             # Si nous avons suffisamment de données temporelles
             if len(df_evolution) > 1:
                 fig = px.line(
                     df_evolution,
                     x="Date",
-                    y="Vues_Cumulées",
-                    title="Évolution Réelle des Vues par Date",
+                    y="Vues",
+                    title="Évolution Réelle des Vues par Jour",
                     markers=True,
                 )
                 fig.update_layout(
@@ -1262,27 +1272,17 @@ elif page == "Analyses Détaillées":
         st.divider()
         st.subheader("Analyse Croisée")
 
-        visiteurs = db.get_visiteurs()
-        if visiteurs:
-            df_visiteurs = pd.DataFrame(
-                visiteurs,
-                columns=[
-                    "ID",
-                    "Type Visiteur",
-                    "Temps Séjour",
-                    "Tranche Âge",
-                    "Centres d'intérêt",
-                    "Date Visite",
-                ],
-            )
-
+        if stats["type_visiteur"]:
             # Heatmap des corrélations
             col1, col2 = st.columns(2)
 
             with col1:
                 # Croiser type visiteur et centres d'intérêt
-                cross_tab = pd.crosstab(
-                    df_visiteurs["Type Visiteur"], df_visiteurs["Centres d'intérêt"]
+                cross_tab = crosstab_visiteurs(
+                    "type_visiteur",
+                    "type_personna",
+                    "Type Visiteur",
+                    "Centres d'intérêt",
                 )
                 fig = px.imshow(
                     cross_tab,
@@ -1295,8 +1295,8 @@ elif page == "Analyses Détaillées":
 
             with col2:
                 # Croiser âge et durée de séjour
-                cross_tab2 = pd.crosstab(
-                    df_visiteurs["Tranche Âge"], df_visiteurs["Temps Séjour"]
+                cross_tab2 = crosstab_visiteurs(
+                    "tranche_age", "temps_sejour", "Tranche Âge", "Temps Séjour"
                 )
                 fig = px.imshow(
                     cross_tab2,
@@ -0,0 +1,46 @@
+"""
+Accès asynchrone à la base de données pour l'API
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDatabaseManager:
+    """
+    Enveloppe asynchrone de DatabaseManager.
+
+    Chaque méthode de DatabaseManager est exposée comme une coroutine exécutée
+    dans un pool de threads dédié et borné, afin que les appels SQLite
+    bloquants ne figent pas la boucle d'événements.
+    """
+
+    def __init__(self, db, max_workers=8):
+        self.db = db
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="db"
+        )
+
+    async def run(self, func, *args, **kwargs):
+        """Exécute une fonction bloquante dans le pool de la base"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return method
+
+    def shutdown(self, wait=True):
+        """Arrête le pool de threads"""
+        self._executor.shutdown(wait=wait)
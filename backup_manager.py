@@ -1,5 +1,5 @@
 import os
-import shutil
+import sqlite3
 from datetime import datetime
 from database import DatabaseManager
 
@@ -24,12 +24,23 @@ class BackupManager:
         backup_path = os.path.join(self.backup_dir, backup_name)
 
         try:
-            shutil.copy2(self.db_path, backup_path)
+            # API de sauvegarde SQLite : copie cohérente même en mode WAL
+            self._copy_database(self.db_path, backup_path)
             return backup_path
         except Exception as e:
             print(f"Erreur lors de la création de la sauvegarde: {e}")
             return None
 
+    def _copy_database(self, source_path, dest_path):
+        """Copie une base SQLite vers une autre via l'API de sauvegarde"""
+        source = sqlite3.connect(source_path)
+        dest = sqlite3.connect(dest_path)
+        try:
+            source.backup(dest)
+        finally:
+            dest.close()
+            source.close()
+
     def list_backups(self):
         """Liste toutes les sauvegardes disponibles"""
         if not os.path.exists(self.backup_dir):
@@ -55,9 +66,20 @@ class BackupManager:
         return sorted(backups, key=lambda x: x["date"], reverse=True)
 
     def restore_backup(self, backup_path):
-        """Restaure une sauvegarde"""
+        """
+        Restaure une sauvegarde
+
+        La base restaurée est mise à niveau puis reçoit une nouvelle
+        génération : les processus qui l'utilisent (API, application)
+        rechargent leur dictionnaire des modalités et vident leur cache.
+        """
         try:
-            shutil.copy2(backup_path, self.db_path)
+            self._copy_database(backup_path, self.db_path)
+            db = DatabaseManager(self.db_path, ecrivain_unique=False)
+            try:
+                db.marquer_restauration()
+            finally:
+                db.close()
             return True
         except Exception as e:
             print(f"Erreur lors de la restauration: {e}")
@@ -0,0 +1,66 @@
+"""
+Cache mémoire des résultats de lecture (LRU borné, expiration par entrée)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Cache LRU thread-safe avec durée de vie par entrée.
+
+    Le cache ne connaît pas les écritures : l'appelant inclut dans la clé la
+    version des données lues (voir database.en_cache), si bien qu'une écriture
+    rend les anciennes clés inaccessibles au lieu de les supprimer. Elles
+    sortent ensuite du cache par ancienneté (LRU) ou à expiration ; la durée
+    de vie ne borne donc que la mémoire, pas la fraîcheur des résultats.
+    """
+
+    def __init__(self, max_entries=1024, ttl=5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # clé -> (expiration, valeur)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        """Retourne (trouvé, valeur)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return False, None
+            expiration, value = entry
+            if expiration < time.monotonic():
+                del self._entries[key]
+                self.stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        """Met une valeur en cache pour `ttl` secondes (durée par défaut sinon)"""
+        with self._lock:
+            self._entries.pop(key, None)
+            expiration = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self._entries[key] = (expiration, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """Retourne les compteurs du cache"""
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entrees": len(self._entries),
+                "taux_succes": self.stats["hits"] / total if total else 0.0,
+            }
@@ -1,32 +1,493 @@
 import sqlite3
+from concurrent.futures import Future, TimeoutError as DelaiDepasseError
 from datetime import datetime
+import functools
 import os
+import queue
+import random
+import threading
+import time
+
+from writer import SingleWriter
+
+
+# Réglages appliqués à chaque nouvelle connexion
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -20000",  # 20 Mo
+    "PRAGMA mmap_size = 268435456",  # 256 Mo
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Attente maximale de SQLite sur un verrou pendant une tentative d'écriture ;
+# au-delà, DatabaseManager réessaie lui-même avec un délai croissant
+BUSY_TIMEOUT_ECRITURE_MS = 100
+ATTENTE_VERROU_INITIALE = 0.01  # secondes
+ATTENTE_VERROU_MAX = 0.5
+
+# Dimensions catégorielles décrivant un visiteur
+DIMENSIONS_VISITEURS = ("type_visiteur", "temps_sejour", "tranche_age", "type_personna")
+
+# Domaines de données suivis par le cache : colonne de version_donnees de chaque
+# domaine, et domaine de chaque table dont les triggers incrémentent la version
+COLONNES_VERSIONS = {
+    "visiteurs": "version_visiteurs",
+    "vues_pages": "version_vues_pages",
+    "vues_totales": "version_vues_totales",
+}
+TABLES_VERSIONNEES = {
+    "visiteurs": "visiteurs",
+    "vues_pages": "vues_pages",
+    "vues_totales_shards": "vues_totales",
+}
+
+
+class BaseVerrouilleeError(sqlite3.OperationalError):
+    """La base est restée verrouillée par un autre écrivain jusqu'au délai maximal"""
+
+    def __init__(self, message, tentatives=0, retry_after=1):
+        super().__init__(message)
+        self.tentatives = tentatives
+        self.retry_after = retry_after
+
+
+def _est_verrouillee(erreur):
+    """Vrai si l'erreur SQLite vient d'un verrou (SQLITE_BUSY / SQLITE_LOCKED)"""
+    code = getattr(erreur, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(erreur)
+
+
+class PooledConnection:
+    """
+    Connexion empruntée au pool.
+
+    S'utilise comme une connexion sqlite3 ; close() annule la transaction en
+    cours éventuelle et rend la connexion au pool au lieu de la fermer.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool.release(conn)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Pool thread-safe de connexions SQLite réutilisées entre les appels"""
+
+    def __init__(self, db_path, max_idle=8, cached_statements=256):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Emprunte une connexion inactive ou en ouvre une nouvelle"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Rend une connexion au pool (fermée si le pool est plein)"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def close_all(self):
+        """Ferme toutes les connexions inactives"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# Expressions SQL qui ramènent une date au début de sa période
+EXPRESSIONS_PERIODES = {
+    "heure": "strftime('%Y-%m-%d %H:00:00', {})",
+    "jour": "date({})",
+    "semaine": "date({}, 'weekday 0', '-6 days')",  # lundi de la semaine
+    "mois": "strftime('%Y-%m-01', {})",
+}
+
+
+def _expression_periode(granularite, colonne):
+    if granularite not in EXPRESSIONS_PERIODES:
+        raise ValueError(f"Granularité inconnue: {granularite}")
+    if granularite == "jour" and colonne == "jour":
+        return colonne
+    return EXPRESSIONS_PERIODES[granularite].format(colonne)
+
+
+def _conditions_periode(colonne, horodatee, date_debut=None, date_fin=None):
+    """
+    Conditions de période sur une colonne de dates
+
+    `horodatee` indique une colonne AAAA-MM-JJ HH:MM:SS ; sinon la colonne
+    contient des jours et les bornes sont tronquées au jour.
+    """
+    conditions = []
+    params = []
+    if date_debut:
+        conditions.append(f"{colonne} >= ?")
+        params.append(str(date_debut) if horodatee else str(date_debut)[:10])
+    if date_fin:
+        date_fin = str(date_fin)
+        if not horodatee:
+            conditions.append(f"{colonne} <= ?")
+            params.append(date_fin[:10])
+        elif len(date_fin) == 10:
+            # Date seule : inclure toute la journée
+            conditions.append(f"{colonne} < date(?, '+1 day')")
+            params.append(date_fin)
+        else:
+            conditions.append(f"{colonne} <= ?")
+            params.append(date_fin)
+    return conditions, params
+
+
+def _table_existe(cursor, nom):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (nom,))
+    return cursor.fetchone() is not None
+
+
+def _figer(valeur):
+    """Rend hashables les arguments (listes -> tuples) pour construire une clé de cache"""
+    if isinstance(valeur, (list, tuple)):
+        return tuple(_figer(v) for v in valeur)
+    return valeur
+
+
+def en_cache(*tables, ttl=None):
+    """
+    Met en cache le résultat d'une lecture dépendant des tables données
+
+    La clé inclut la version de chacune des tables lues (incrémentée par
+    trigger quel que soit le processus qui écrit), prise avant le calcul : un
+    résultat n'est jamais servi pour des données plus récentes que celles
+    qu'il reflète, et une écriture sur une autre table ne le rend pas caduc.
+    Les versions viennent de l'instantané de _lire_versions : un succès ne
+    coûte aucune requête SQLite.
+    """
+
+    def decorateur(methode):
+        @functools.wraps(methode)
+        def enveloppe(self, *args, **kwargs):
+            if self.cache is None:
+                return methode(self, *args, **kwargs)
+            versions = self._lire_versions()
+            cle = (
+                methode.__name__,
+                versions["generation"],
+                tuple(versions[table] for table in tables),
+                _figer(args),
+                _figer(sorted(kwargs.items())),
+            )
+            trouve, valeur = self.cache.get(cle)
+            if trouve:
+                return valeur
+            valeur = methode(self, *args, **kwargs)
+            self.cache.set(cle, valeur, ttl=ttl)
+            return valeur
+
+        return enveloppe
+
+    return decorateur
+
+
+def invalide_cache(*tables):
+    """
+    Périme l'instantané des versions après une écriture de ce processus
+
+    La lecture suivante relit les versions : elle voit aussitôt l'écriture.
+    """
+
+    def decorateur(methode):
+        @functools.wraps(methode)
+        def enveloppe(self, *args, **kwargs):
+            try:
+                return methode(self, *args, **kwargs)
+            finally:
+                self._instantane_versions = None
+
+        return enveloppe
+
+    return decorateur
 
 
 class DatabaseManager:
-    def __init__(self, db_path="tourisme_data.db"):
+    def __init__(
+        self,
+        db_path="tourisme_data.db",
+        pool_size=8,
+        cache=None,
+        shards_vues_totales=8,
+        delai_verrou=10.0,
+        ecrivain_unique=True,
+        intervalle_versions=1.0,
+    ):
         self.db_path = db_path
+        # Durée maximale (secondes) pendant laquelle une écriture est réessayée
+        # quand la base est verrouillée par un autre processus
+        self.delai_verrou = delai_verrou
+        self._stats_verrous_lock = threading.Lock()
+        self.stats_verrous = {
+            "ecritures": 0,
+            "reessais": 0,
+            "ecritures_reessayees": 0,
+            "echecs_verrou": 0,
+            "attente_totale_s": 0.0,
+        }
+        # Nombre de lignes entre lesquelles le compteur de vues totales est réparti
+        self.shards_vues_totales = max(1, shards_vues_totales)
+        # Cache optionnel des lectures (voir cache.ResultCache)
+        self.cache = cache
+        self.pool = ConnectionPool(db_path, max_idle=pool_size)
+        # Cache des modalités : (dimension, libellé) -> code et code -> libellé
+        self._modalites_lock = threading.Lock()
+        self._codes = {}
+        self._libelles = {}
+        # Génération de la base lors du chargement du dictionnaire
+        self._generation = None
+        self._prochaine_verification = 0.0
+        # Versions des données lues en dernier : (expiration, versions). Relues
+        # au plus toutes les `intervalle_versions` secondes, ou après une écriture
+        # de ce processus ; c'est le délai maximal avant qu'une écriture d'un
+        # autre processus soit visible dans le cache
+        self.intervalle_versions = intervalle_versions
+        self._instantane_versions = None
+        self.ecrivain = None
         self.init_database()
+        # Écrivain unique : un thread possède la connexion d'écriture et regroupe
+        # les écritures en transactions ; les lectures utilisent le pool
+        if ecrivain_unique:
+            self.ecrivain = SingleWriter(self._connexion_ecrivain, self._reessayer)
+            self.ecrivain.start()
 
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """Emprunte une connexion au pool ; close() la rend au pool"""
+        return self.pool.acquire()
+
+    def close(self):
+        """Arrête l'écrivain et ferme les connexions du pool"""
+        if self.ecrivain is not None:
+            self.ecrivain.stop()
+            self.ecrivain = None
+        self.pool.close_all()
+
+    def get_stats_verrous(self):
+        """Retourne les compteurs de contention sur les écritures"""
+        with self._stats_verrous_lock:
+            return dict(self.stats_verrous)
+
+    def _compter(self, **increments):
+        with self._stats_verrous_lock:
+            for cle, valeur in increments.items():
+                self.stats_verrous[cle] += valeur
+
+    def _reessayer(self, fonction, echeance=None):
+        """
+        Appelle fonction() (une transaction) et retourne son résultat
+
+        Si la base est verrouillée, l'appel est rejoué avec un délai
+        exponentiel aléatoire (full jitter) jusqu'à `echeance` (instant
+        time.monotonic()), par défaut `delai_verrou` secondes, puis
+        BaseVerrouilleeError est levée.
+        """
+        limite = echeance if echeance is not None else time.monotonic() + self.delai_verrou
+        tentatives = 0
+        while True:
+            try:
+                result = fonction()
+            except sqlite3.OperationalError as e:
+                if not _est_verrouillee(e):
+                    raise
+                tentatives += 1
+                attente = random.uniform(
+                    0, min(ATTENTE_VERROU_MAX, ATTENTE_VERROU_INITIALE * 2**tentatives)
+                )
+                if time.monotonic() + attente > limite:
+                    self._compter(ecritures=1, echecs_verrou=1)
+                    raise BaseVerrouilleeError(
+                        f"Base de données verrouillée après {tentatives} tentatives",
+                        tentatives=tentatives,
+                    ) from e
+                self._compter(reessais=1, attente_totale_s=attente)
+                time.sleep(attente)
+                continue
+            self._compter(ecritures=1, ecritures_reessayees=1 if tentatives else 0)
+            return result
+
+    def _transaction(self, operation):
+        """Exécute operation(cursor) sur une connexion du pool et valide"""
+        conn = self.get_connection()
+        try:
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_ECRITURE_MS}")
+            result = operation(conn.cursor())
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA busy_timeout = 5000")
+            conn.close()
+
+    def _connexion_ecrivain(self):
+        """Connexion dédiée au thread d'écriture (transactions explicites)"""
+        conn = self.pool._connect()
+        conn.isolation_level = None
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_ECRITURE_MS}")
+        return conn
+
+    def _ecrire(self, operation):
+        """
+        Exécute operation(cursor) dans une transaction et retourne son résultat
+
+        Avec l'écrivain unique, l'opération est regroupée avec les autres
+        écritures en attente ; sinon elle s'exécute sur une connexion du pool.
+        La transaction est annulée en cas d'erreur.
+
+        `delai_verrou` borne l'appel entier, attente dans la file de l'écrivain
+        comprise : au-delà, BaseVerrouilleeError est levée.
+        """
+        if self.ecrivain is None:
+            return self._reessayer(lambda: self._transaction(operation))
+        echeance = time.monotonic() + self.delai_verrou
+        future = self.ecrivain.soumettre(operation, echeance)
+        try:
+            return future.result(timeout=max(0.0, echeance - time.monotonic()))
+        except DelaiDepasseError:
+            if not future.cancel():
+                # Déjà en cours : l'écrivain ne réessaie pas au-delà de l'échéance
+                return future.result()
+        self._compter(ecritures=1, echecs_verrou=1)
+        raise BaseVerrouilleeError(
+            f"File d'écriture encore occupée après {self.delai_verrou:g}s"
+        )
+
+    def soumettre_ecriture(self, operation, *tables):
+        """
+        Soumet operation(cursor) sans attendre et retourne un Future
+
+        Les lectures en cache sont revalidées une fois l'écriture terminée ;
+        `tables` (tables modifiées) est conservé pour compatibilité.
+        """
+        if self.ecrivain is not None:
+            future = self.ecrivain.soumettre(
+                operation, time.monotonic() + self.delai_verrou
+            )
+        else:
+            future = Future()
+            try:
+                future.set_result(self._ecrire(operation))
+            except Exception as e:
+                future.set_exception(e)
+        future.add_done_callback(lambda _: setattr(self, "_instantane_versions", None))
+        return future
+
+    def _migrer(self, conn, necessaire, migration):
+        """
+        Applique migration(cursor) si necessaire(cursor), sous le verrou d'écriture
+
+        Le besoin est revérifié après BEGIN IMMEDIATE : quand plusieurs
+        processus démarrent en même temps sur une base non migrée, un seul
+        migre et les autres voient le schéma à jour. Retourne True si la
+        migration a été appliquée.
+        """
+        cursor = conn.cursor()
+        if not necessaire(cursor):
+            return False
+        if conn.in_transaction:
+            conn.commit()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if not necessaire(cursor):
+                conn.rollback()
+                return False
+            migration(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return True
 
     def init_database(self):
         """Initialise la base de données avec les tables nécessaires"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        # Table pour les vues totales du site
+        # Vues totales du site : compteur réparti sur plusieurs lignes (shards)
+        # par jour, la somme donne le total et l'historique reste disponible
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS vues_totales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE DEFAULT CURRENT_DATE,
-                nombre_vues INTEGER DEFAULT 0
-            )
+            CREATE TABLE IF NOT EXISTS vues_totales_shards (
+                jour TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                nombre_vues INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (jour, shard)
+            ) WITHOUT ROWID
         """
         )
 
+        # Migration : reprise du compteur de l'ancienne table vues_totales
+        def migrer_vues_totales(cursor):
+            cursor.execute(
+                """
+                INSERT INTO vues_totales_shards (jour, shard, nombre_vues)
+                SELECT COALESCE(date, date('now')), 0, nombre_vues
+                FROM vues_totales WHERE id = 1 AND nombre_vues > 0
+                ON CONFLICT (jour, shard) DO UPDATE
+                SET nombre_vues = nombre_vues + excluded.nombre_vues
+            """
+            )
+            cursor.execute("DROP TABLE vues_totales")
+            # Le résumé est recalculé plus bas à partir des shards
+            cursor.execute("DROP TABLE IF EXISTS resume_statistiques")
+
+        self._migrer(
+            conn, lambda cursor: _table_existe(cursor, "vues_totales"), migrer_vues_totales
+        )
+
         # Table pour les vues par page
         cursor.execute(
             """
@@ -40,211 +501,1101 @@ class DatabaseManager:
         """
         )
 
+        # Dictionnaire des valeurs catégorielles : un code entier par (dimension, libellé)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS modalites (
+                code INTEGER PRIMARY KEY,
+                dimension TEXT NOT NULL,
+                libelle TEXT NOT NULL,
+                UNIQUE (dimension, libelle)
+            )
+        """
+        )
+
         # Table pour les visiteurs (valeurs libres, sans contraintes CHECK)
+        # Les quatre dimensions sont stockées sous forme de codes de `modalites`
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS visiteurs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                type_visiteur TEXT NOT NULL,
-                temps_sejour TEXT NOT NULL,
-                tranche_age TEXT NOT NULL,
-                type_personna TEXT NOT NULL,
+                type_visiteur INTEGER NOT NULL,
+                temps_sejour INTEGER NOT NULL,
+                tranche_age INTEGER NOT NULL,
+                type_personna INTEGER NOT NULL,
                 date_visite DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         """
         )
 
         # Migration: si d'anciennes contraintes CHECK existent, recréer la table sans contraintes
+        def contraintes_check(cursor):
+            cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE type='table' AND name='visiteurs'"
+            )
+            table_sql_row = cursor.fetchone()
+            return bool(
+                table_sql_row and table_sql_row[0] and "CHECK" in table_sql_row[0].upper()
+            )
+
+        def retirer_contraintes_check(cursor):
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS visiteurs__new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    type_visiteur TEXT NOT NULL,
+                    temps_sejour TEXT NOT NULL,
+                    tranche_age TEXT NOT NULL,
+                    type_personna TEXT NOT NULL,
+                    date_visite DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            cursor.execute(
+                "INSERT INTO visiteurs__new (id, type_visiteur, temps_sejour, tranche_age, type_personna, date_visite) "
+                "SELECT id, type_visiteur, temps_sejour, tranche_age, type_personna, date_visite FROM visiteurs"
+            )
+            cursor.execute("DROP TABLE visiteurs")
+            cursor.execute("ALTER TABLE visiteurs__new RENAME TO visiteurs")
+
         try:
+            self._migrer(conn, contraintes_check, retirer_contraintes_check)
+        except Exception:
+            # Si la migration échoue, on ignore pour ne pas bloquer le démarrage
+            pass
+
+        # Migration: remplacer les libellés stockés en texte par des codes entiers
+        def libelles_en_texte(cursor):
             cursor.execute("PRAGMA table_info(visiteurs)")
-            cols = cursor.fetchall()
-            col_defs = {c[1]: c[2] for c in cols}  # name -> type
-            # Vérification basique: si la définition contient CHECK, on migre
-            cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='visiteurs'")
-            table_sql_row = cursor.fetchone()
-            if table_sql_row and table_sql_row[0] and "CHECK" in table_sql_row[0].upper():
-                cursor.execute("BEGIN")
+            types_colonnes = {c[1]: c[2].upper() for c in cursor.fetchall()}
+            return types_colonnes.get("type_visiteur") == "TEXT"
+
+        def encoder_visiteurs(cursor):
+            for dimension in DIMENSIONS_VISITEURS:
                 cursor.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS visiteurs__new (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        type_visiteur TEXT NOT NULL,
-                        temps_sejour TEXT NOT NULL,
-                        tranche_age TEXT NOT NULL,
-                        type_personna TEXT NOT NULL,
-                        date_visite DATETIME DEFAULT CURRENT_TIMESTAMP
+                    f"""
+                    INSERT OR IGNORE INTO modalites (dimension, libelle)
+                    SELECT DISTINCT '{dimension}', {dimension} FROM visiteurs
+                """
+                )
+            cursor.execute(
+                """
+                CREATE TABLE visiteurs__codes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    type_visiteur INTEGER NOT NULL,
+                    temps_sejour INTEGER NOT NULL,
+                    tranche_age INTEGER NOT NULL,
+                    type_personna INTEGER NOT NULL,
+                    date_visite DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """
+            )
+            codes = ", ".join(
+                f"(SELECT code FROM modalites WHERE dimension = '{d}' AND libelle = v.{d})"
+                for d in DIMENSIONS_VISITEURS
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO visiteurs__codes
+                    (id, type_visiteur, temps_sejour, tranche_age, type_personna, date_visite)
+                SELECT v.id, {codes}, v.date_visite FROM visiteurs v
+            """
+            )
+            cursor.execute("DROP TABLE visiteurs")
+            cursor.execute("ALTER TABLE visiteurs__codes RENAME TO visiteurs")
+            # Le cube est reconstruit plus bas avec des codes
+            cursor.execute("DROP TABLE IF EXISTS cube_visiteurs")
+
+        if self._migrer(conn, libelles_en_texte, encoder_visiteurs):
+            # Récupérer l'espace libéré par les anciens libellés (facultatif :
+            # un autre processus peut occuper la base au même moment)
+            try:
+                cursor.execute("VACUUM")
+            except sqlite3.OperationalError:
+                pass
+
+        # Vue décodée pour les requêtes SQL manuelles et les outils externes
+        libelles = ", ".join(f"m_{d}.libelle AS {d}" for d in DIMENSIONS_VISITEURS)
+        jointures = " ".join(
+            f"JOIN modalites m_{d} ON m_{d}.code = v.{d}" for d in DIMENSIONS_VISITEURS
+        )
+        cursor.execute(
+            f"""
+            CREATE VIEW IF NOT EXISTS visiteurs_libelles AS
+            SELECT v.id, {libelles}, v.date_visite FROM visiteurs v {jointures}
+        """
+        )
+
+        # Migration: une seule ligne par (nom_page, categorie), garantie par un index unique
+        def index_pages_absent(cursor):
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_vues_pages_page_categorie'"
+            )
+            return cursor.fetchone() is None
+
+        def fusionner_pages(cursor):
+            # Fusionner les doublons dans la ligne la plus ancienne
+            cursor.execute(
+                """
+                UPDATE vues_pages
+                SET nombre_vues = (
+                        SELECT SUM(v.nombre_vues) FROM vues_pages v
+                        WHERE v.nom_page = vues_pages.nom_page AND v.categorie = vues_pages.categorie
+                    ),
+                    date_derniere_vue = (
+                        SELECT MAX(v.date_derniere_vue) FROM vues_pages v
+                        WHERE v.nom_page = vues_pages.nom_page AND v.categorie = vues_pages.categorie
                     )
-                    """
+                WHERE id IN (
+                    SELECT MIN(id) FROM vues_pages
+                    GROUP BY nom_page, categorie HAVING COUNT(*) > 1
                 )
+            """
+            )
+            cursor.execute(
+                """
+                DELETE FROM vues_pages
+                WHERE id NOT IN (SELECT MIN(id) FROM vues_pages GROUP BY nom_page, categorie)
+            """
+            )
+            cursor.execute(
+                "CREATE UNIQUE INDEX idx_vues_pages_page_categorie ON vues_pages (nom_page, categorie)"
+            )
+
+        self._migrer(conn, index_pages_absent, fusionner_pages)
+
+        # Index sur la date de visite (dernière activité, tri chronologique)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_visiteurs_date_visite ON visiteurs (date_visite, id)"
+        )
+
+        # Historique des vues de pages : journal d'événements en ajout seul et
+        # agrégats horaires/journaliers par (page, catégorie) maintenus par triggers
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS evenements_pages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nom_page TEXT NOT NULL,
+                categorie TEXT NOT NULL,
+                nombre INTEGER NOT NULL DEFAULT 1,
+                date_vue DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """
+        )
+        for table, colonne in (
+            ("vues_pages_horaires", "heure"),
+            ("vues_pages_journalieres", "jour"),
+        ):
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {colonne} TEXT NOT NULL,
+                    nom_page TEXT NOT NULL,
+                    categorie TEXT NOT NULL,
+                    nombre_vues INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY ({colonne}, nom_page, categorie)
+                ) WITHOUT ROWID
+            """
+            )
+
+        # Cube des visiteurs : nombre de visiteurs par jour et combinaison de dimensions
+        def creer_cube(cursor):
+            cursor.execute(
+                """
+                CREATE TABLE cube_visiteurs (
+                    jour TEXT NOT NULL,
+                    type_visiteur INTEGER NOT NULL,
+                    temps_sejour INTEGER NOT NULL,
+                    tranche_age INTEGER NOT NULL,
+                    type_personna INTEGER NOT NULL,
+                    nombre INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (jour, type_visiteur, temps_sejour, tranche_age, type_personna)
+                ) WITHOUT ROWID
+            """
+            )
+            cursor.execute(
+                """
+                INSERT INTO cube_visiteurs
+                    (jour, type_visiteur, temps_sejour, tranche_age, type_personna, nombre)
+                SELECT date(date_visite), type_visiteur, temps_sejour, tranche_age, type_personna, COUNT(*)
+                FROM visiteurs
+                GROUP BY 1, 2, 3, 4, 5
+            """
+            )
+
+        self._migrer(
+            conn, lambda cursor: not _table_existe(cursor, "cube_visiteurs"), creer_cube
+        )
+
+        # Résumé maintenu par triggers : /stats lit une seule ligne
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS resume_statistiques (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                nombre_visiteurs INTEGER NOT NULL DEFAULT 0,
+                nombre_pages INTEGER NOT NULL DEFAULT 0,
+                vues_totales INTEGER NOT NULL DEFAULT 0,
+                derniere_activite DATETIME
+            )
+        """
+        )
+        cursor.execute("SELECT COUNT(*) FROM resume_statistiques")
+        if cursor.fetchone()[0] == 0:
+            self._refresh_resume_statistiques(cursor)
+
+        # Version des données : incrémentée par trigger à chaque écriture,
+        # elle permet de savoir si une réponse en cache est encore valide
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS version_donnees (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0,
+                date_modification DATETIME DEFAULT CURRENT_TIMESTAMP,
+                generation TEXT,
+                version_visiteurs INTEGER NOT NULL DEFAULT 0,
+                version_vues_pages INTEGER NOT NULL DEFAULT 0,
+                version_vues_totales INTEGER NOT NULL DEFAULT 0
+            )
+        """
+        )
+        cursor.execute("INSERT OR IGNORE INTO version_donnees (id, version) VALUES (1, 0)")
+        # Génération : identifiant aléatoire remplacé à chaque restauration, pour
+        # que les autres processus rechargent leur dictionnaire et leur cache
+        cursor.execute("PRAGMA table_info(version_donnees)")
+        if "generation" not in {c[1] for c in cursor.fetchall()}:
+            try:
+                cursor.execute("ALTER TABLE version_donnees ADD COLUMN generation TEXT")
+            except sqlite3.OperationalError:
+                pass  # ajoutée au même moment par un autre processus
+        cursor.execute(
+            """
+            UPDATE version_donnees SET generation = lower(hex(randomblob(8)))
+            WHERE id = 1 AND generation IS NULL
+        """
+        )
+
+        # Versions par table : les triggers antérieurs n'incrémentaient que la
+        # version globale, ils sont recréés avec les nouvelles colonnes
+        def versions_par_table_absentes(cursor):
+            cursor.execute("PRAGMA table_info(version_donnees)")
+            return "version_visiteurs" not in {c[1] for c in cursor.fetchall()}
+
+        def ajouter_versions_par_table(cursor):
+            for colonne in COLONNES_VERSIONS.values():
                 cursor.execute(
-                    "INSERT INTO visiteurs__new (id, type_visiteur, temps_sejour, tranche_age, type_personna, date_visite) "
-                    "SELECT id, type_visiteur, temps_sejour, tranche_age, type_personna, date_visite FROM visiteurs"
+                    f"ALTER TABLE version_donnees ADD COLUMN {colonne} INTEGER NOT NULL DEFAULT 0"
                 )
-                cursor.execute("DROP TABLE visiteurs")
-                cursor.execute("ALTER TABLE visiteurs__new RENAME TO visiteurs")
-                conn.commit()
-        except Exception:
-            # Si la migration échoue, on ignore pour ne pas bloquer le démarrage
-            pass
+            for table in TABLES_VERSIONNEES:
+                for operation in ("insert", "update", "delete"):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS trg_version_{table}_{operation}")
+            self._create_triggers_version(cursor)
 
-        # Insérer une donnée initiale pour les vues totales si elle n'existe pas
-        cursor.execute("SELECT COUNT(*) FROM vues_totales")
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("INSERT INTO vues_totales (nombre_vues) VALUES (0)")
+        self._migrer(conn, versions_par_table_absentes, ajouter_versions_par_table)
+
+        # Segments du spool d'ingestion déjà appliqués (voir spool.py) : le nom
+        # est inséré dans la même transaction que les événements du segment
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS segments_appliques (
+                nom TEXT PRIMARY KEY,
+                nombre_evenements INTEGER NOT NULL,
+                date_application DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """
+        )
+
+        # Identifiants de lots et d'événements déjà ingérés (voir dedup.py)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS identifiants_ingestion (
+                cle TEXT PRIMARY KEY,
+                date_reception DATETIME DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_identifiants_ingestion_date ON identifiants_ingestion (date_reception)"
+        )
+        self._create_triggers(cursor)
 
         conn.commit()
         conn.close()
+        self._charger_modalites()
 
-    def increment_vues_totales(self):
-        """Incrémente le nombre de vues totales du site"""
+    def _charger_modalites(self):
+        """Charge le dictionnaire des modalités dans le cache"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT code, dimension, libelle FROM modalites")
+        result = cursor.fetchall()
+        cursor.execute("SELECT generation FROM version_donnees WHERE id = 1")
+        ligne = cursor.fetchone()
+        conn.close()
+        with self._modalites_lock:
+            if ligne and ligne[0] != self._generation:
+                # Base restaurée : les codes ont pu changer de sens
+                self._codes = {}
+                self._libelles = {}
+                self._generation = ligne[0]
+            for code, dimension, libelle in result:
+                self._codes[(dimension, libelle)] = code
+                self._libelles[code] = libelle
+
+    def recharger(self):
+        """
+        Recharge le dictionnaire des modalités et vide le cache des lectures
+
+        À appeler après le remplacement du fichier de base (restauration).
+        """
+        with self._modalites_lock:
+            self._generation = None
+        self._charger_modalites()
+        self._instantane_versions = None
+        if self.cache is not None:
+            self.cache.clear()
+
+    def _synchroniser_modalites(self, generation=None, forcer=False):
+        """
+        Recharge dictionnaire et cache si la base a été restaurée entre-temps
+
+        La génération est relue au plus une fois par seconde, sauf si
+        `forcer` (écritures) ou si l'appelant vient de la lire.
+        """
+        if generation is None:
+            if not forcer and time.monotonic() < self._prochaine_verification:
+                return
+            conn = self.get_connection()
+            ligne = conn.execute(
+                "SELECT generation FROM version_donnees WHERE id = 1"
+            ).fetchone()
+            conn.close()
+            generation = ligne[0] if ligne else None
+        self._prochaine_verification = time.monotonic() + 1
+        if generation != self._generation:
+            self.recharger()
+
+    def marquer_restauration(self):
+        """Change la génération de la base après le remplacement de son contenu"""
+        self._ecrire(
+            lambda cursor: cursor.execute(
+                """
+                UPDATE version_donnees
+                SET generation = lower(hex(randomblob(8))), version = version + 1,
+                    date_modification = CURRENT_TIMESTAMP
+                WHERE id = 1
+            """
+            )
+        )
+        self.recharger()
+
+    def _encoder(self, valeurs):
+        """
+        Retourne les codes de tuples de libellés (dans l'ordre de DIMENSIONS_VISITEURS)
+
+        Les libellés inconnus sont ajoutés au dictionnaire dans une transaction
+        séparée, validée avant l'écriture qui les utilise.
+        """
+        self._synchroniser_modalites(forcer=True)
+        valeurs = [tuple(v) for v in valeurs]
+        manquants = {
+            (dimension, libelle)
+            for v in valeurs
+            for dimension, libelle in zip(DIMENSIONS_VISITEURS, v)
+            if (dimension, libelle) not in self._codes
+        }
+        if manquants:
+            self._ecrire(
+                lambda cursor: cursor.executemany(
+                    "INSERT OR IGNORE INTO modalites (dimension, libelle) VALUES (?, ?)",
+                    list(manquants),
+                )
+            )
+            self._charger_modalites()
+        return [
+            tuple(self._codes[(d, libelle)] for d, libelle in zip(DIMENSIONS_VISITEURS, v))
+            for v in valeurs
+        ]
+
+    def _code(self, dimension, libelle):
+        """Code d'un libellé existant, ou None s'il n'a jamais été enregistré"""
+        self._synchroniser_modalites()
+        if (dimension, libelle) not in self._codes:
+            self._charger_modalites()
+        return self._codes.get((dimension, libelle))
+
+    def _libelle(self, code):
+        if code not in self._libelles:
+            self._charger_modalites()
+        return self._libelles.get(code)
+
+    def _decoder(self, ligne, debut, fin):
+        """Remplace les codes des colonnes [debut, fin) d'une ligne par leurs libellés"""
+        if ligne is None:
+            return None
+        self._synchroniser_modalites()
+        return (
+            ligne[:debut]
+            + tuple(self._libelle(code) for code in ligne[debut:fin])
+            + ligne[fin:]
+        )
+
+    def _create_triggers(self, cursor):
+        """Crée les triggers qui maintiennent les tables dérivées"""
+        cursor.executescript(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_resume_visiteurs_insert
+            AFTER INSERT ON visiteurs
+            BEGIN
+                UPDATE resume_statistiques
+                SET nombre_visiteurs = nombre_visiteurs + 1,
+                    derniere_activite = CASE
+                        WHEN derniere_activite IS NULL OR NEW.date_visite > derniere_activite
+                        THEN NEW.date_visite ELSE derniere_activite END
+                WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_resume_visiteurs_delete
+            AFTER DELETE ON visiteurs
+            BEGIN
+                UPDATE resume_statistiques
+                SET nombre_visiteurs = nombre_visiteurs - 1,
+                    derniere_activite = CASE
+                        WHEN OLD.date_visite >= derniere_activite
+                        THEN (SELECT MAX(date_visite) FROM visiteurs)
+                        ELSE derniere_activite END
+                WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_cube_visiteurs_insert
+            AFTER INSERT ON visiteurs
+            BEGIN
+                INSERT INTO cube_visiteurs
+                    (jour, type_visiteur, temps_sejour, tranche_age, type_personna, nombre)
+                VALUES (date(NEW.date_visite), NEW.type_visiteur, NEW.temps_sejour,
+                        NEW.tranche_age, NEW.type_personna, 1)
+                ON CONFLICT (jour, type_visiteur, temps_sejour, tranche_age, type_personna)
+                DO UPDATE SET nombre = nombre + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_cube_visiteurs_delete
+            AFTER DELETE ON visiteurs
+            BEGIN
+                UPDATE cube_visiteurs SET nombre = nombre - 1
+                WHERE jour = date(OLD.date_visite) AND type_visiteur = OLD.type_visiteur
+                    AND temps_sejour = OLD.temps_sejour AND tranche_age = OLD.tranche_age
+                    AND type_personna = OLD.type_personna;
+                DELETE FROM cube_visiteurs
+                WHERE jour = date(OLD.date_visite) AND type_visiteur = OLD.type_visiteur
+                    AND temps_sejour = OLD.temps_sejour AND tranche_age = OLD.tranche_age
+                    AND type_personna = OLD.type_personna AND nombre <= 0;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_cube_visiteurs_update
+            AFTER UPDATE OF type_visiteur, temps_sejour, tranche_age, type_personna, date_visite
+            ON visiteurs
+            BEGIN
+                UPDATE cube_visiteurs SET nombre = nombre - 1
+                WHERE jour = date(OLD.date_visite) AND type_visiteur = OLD.type_visiteur
+                    AND temps_sejour = OLD.temps_sejour AND tranche_age = OLD.tranche_age
+                    AND type_personna = OLD.type_personna;
+                DELETE FROM cube_visiteurs
+                WHERE jour = date(OLD.date_visite) AND type_visiteur = OLD.type_visiteur
+                    AND temps_sejour = OLD.temps_sejour AND tranche_age = OLD.tranche_age
+                    AND type_personna = OLD.type_personna AND nombre <= 0;
+                INSERT INTO cube_visiteurs
+                    (jour, type_visiteur, temps_sejour, tranche_age, type_personna, nombre)
+                VALUES (date(NEW.date_visite), NEW.type_visiteur, NEW.temps_sejour,
+                        NEW.tranche_age, NEW.type_personna, 1)
+                ON CONFLICT (jour, type_visiteur, temps_sejour, tranche_age, type_personna)
+                DO UPDATE SET nombre = nombre + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_resume_pages_insert
+            AFTER INSERT ON vues_pages
+            BEGIN
+                UPDATE resume_statistiques SET nombre_pages = nombre_pages + 1 WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_resume_pages_delete
+            AFTER DELETE ON vues_pages
+            BEGIN
+                UPDATE resume_statistiques SET nombre_pages = nombre_pages - 1 WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_agregats_pages_insert
+            AFTER INSERT ON evenements_pages
+            BEGIN
+                INSERT INTO vues_pages_horaires (heure, nom_page, categorie, nombre_vues)
+                VALUES (strftime('%Y-%m-%d %H:00:00', NEW.date_vue), NEW.nom_page, NEW.categorie, NEW.nombre)
+                ON CONFLICT (heure, nom_page, categorie) DO UPDATE
+                SET nombre_vues = nombre_vues + excluded.nombre_vues;
+                INSERT INTO vues_pages_journalieres (jour, nom_page, categorie, nombre_vues)
+                VALUES (date(NEW.date_vue), NEW.nom_page, NEW.categorie, NEW.nombre)
+                ON CONFLICT (jour, nom_page, categorie) DO UPDATE
+                SET nombre_vues = nombre_vues + excluded.nombre_vues;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_agregats_pages_delete
+            AFTER DELETE ON evenements_pages
+            BEGIN
+                UPDATE vues_pages_horaires SET nombre_vues = nombre_vues - OLD.nombre
+                WHERE heure = strftime('%Y-%m-%d %H:00:00', OLD.date_vue)
+                    AND nom_page = OLD.nom_page AND categorie = OLD.categorie;
+                DELETE FROM vues_pages_horaires
+                WHERE heure = strftime('%Y-%m-%d %H:00:00', OLD.date_vue)
+                    AND nom_page = OLD.nom_page AND categorie = OLD.categorie
+                    AND nombre_vues <= 0;
+                UPDATE vues_pages_journalieres SET nombre_vues = nombre_vues - OLD.nombre
+                WHERE jour = date(OLD.date_vue)
+                    AND nom_page = OLD.nom_page AND categorie = OLD.categorie;
+                DELETE FROM vues_pages_journalieres
+                WHERE jour = date(OLD.date_vue)
+                    AND nom_page = OLD.nom_page AND categorie = OLD.categorie
+                    AND nombre_vues <= 0;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_resume_vues_totales_insert
+            AFTER INSERT ON vues_totales_shards
+            BEGIN
+                UPDATE resume_statistiques SET vues_totales = vues_totales + NEW.nombre_vues
+                WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_resume_vues_totales_update
+            AFTER UPDATE OF nombre_vues ON vues_totales_shards
+            BEGIN
+                UPDATE resume_statistiques
+                SET vues_totales = vues_totales + NEW.nombre_vues - OLD.nombre_vues
+                WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_resume_vues_totales_delete
+            AFTER DELETE ON vues_totales_shards
+            BEGIN
+                UPDATE resume_statistiques SET vues_totales = vues_totales - OLD.nombre_vues
+                WHERE id = 1;
+            END;
+        """
+        )
+        self._create_triggers_version(cursor)
+
+    def _create_triggers_version(self, cursor):
+        """Crée les triggers qui incrémentent la version globale et celle de la table"""
+        for table, domaine in TABLES_VERSIONNEES.items():
+            colonne = COLONNES_VERSIONS[domaine]
+            for operation in ("INSERT", "UPDATE", "DELETE"):
+                cursor.execute(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_version_{table}_{operation.lower()}
+                    AFTER {operation} ON {table}
+                    BEGIN
+                        UPDATE version_donnees
+                        SET version = version + 1, {colonne} = {colonne} + 1,
+                            date_modification = CURRENT_TIMESTAMP
+                        WHERE id = 1;
+                    END
+                """
+                )
+
+    def _lire_versions(self):
+        """
+        Versions des données (globale, par table, génération), depuis l'instantané
+
+        L'instantané est relu en base au plus toutes les `intervalle_versions`
+        secondes, ou à la première lecture après une écriture de ce processus.
+        """
+        instantane = self._instantane_versions
+        if instantane is not None and time.monotonic() < instantane[0]:
+            return instantane[1]
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute(
-            "UPDATE vues_totales SET nombre_vues = nombre_vues + 1, date = CURRENT_DATE WHERE id = 1"
+            f"""
+            SELECT version, date_modification, generation,
+                   {", ".join(COLONNES_VERSIONS.values())}
+            FROM version_donnees WHERE id = 1
+        """
         )
-        conn.commit()
+        ligne = cursor.fetchone()
+        conn.close()
+        if ligne is None:
+            ligne = (0, None, None) + (0,) * len(COLONNES_VERSIONS)
+        versions = {
+            "version": ligne[0],
+            "date_modification": ligne[1],
+            "generation": ligne[2],
+            **dict(zip(COLONNES_VERSIONS, ligne[3:])),
+        }
+        self._synchroniser_modalites(versions["generation"])
+        self._instantane_versions = (
+            time.monotonic() + self.intervalle_versions,
+            versions,
+        )
+        return versions
+
+    def get_version_donnees(self):
+        """
+        Récupère (version, date_modification, generation) des données
+
+        Lue dans le même instantané que les clés du cache : une réponse
+        construite ensuite n'est jamais plus ancienne que cette version.
+        """
+        versions = self._lire_versions()
+        return (
+            versions["version"],
+            versions["date_modification"],
+            versions["generation"],
+        )
+
+    def _refresh_resume_statistiques(self, cursor):
+        """Recalcule entièrement la ligne de résumé à partir des tables"""
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO resume_statistiques
+                (id, nombre_visiteurs, nombre_pages, vues_totales, derniere_activite)
+            SELECT 1,
+                (SELECT COUNT(*) FROM visiteurs),
+                (SELECT COUNT(*) FROM vues_pages),
+                COALESCE((SELECT SUM(nombre_vues) FROM vues_totales_shards), 0),
+                (SELECT MAX(date_visite) FROM visiteurs)
+        """
+        )
+
+    @en_cache("visiteurs", "vues_pages", "vues_totales")
+    def get_resume_statistiques(self):
+        """Récupère le résumé (visiteurs, pages, vues totales, dernière activité)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT nombre_visiteurs, nombre_pages, vues_totales, derniere_activite
+            FROM resume_statistiques WHERE id = 1
+        """
+        )
+        result = cursor.fetchone()
         conn.close()
+        if not result:
+            return {
+                "nombre_visiteurs": 0,
+                "nombre_pages": 0,
+                "vues_totales": 0,
+                "derniere_activite": None,
+            }
+        return {
+            "nombre_visiteurs": result[0],
+            "nombre_pages": result[1],
+            "vues_totales": result[2],
+            "derniere_activite": result[3],
+        }
+
+    def _ajouter_vues_totales(self, cursor, nombre):
+        """
+        Ajoute des vues au compteur du jour
 
+        Chaque processus/thread écrit dans son propre shard, ce qui évite que
+        toutes les écritures portent sur la même ligne.
+        """
+        shard = hash((os.getpid(), threading.get_ident())) % self.shards_vues_totales
+        cursor.execute(
+            """
+            INSERT INTO vues_totales_shards (jour, shard, nombre_vues)
+            VALUES (date('now'), ?, ?)
+            ON CONFLICT (jour, shard) DO UPDATE
+            SET nombre_vues = nombre_vues + excluded.nombre_vues
+        """,
+            (shard, nombre),
+        )
+
+    @invalide_cache("vues_totales")
+    def increment_vues_totales(self, nombre=1):
+        """Incrémente le nombre de vues totales du site"""
+        self._ecrire(lambda cursor: self._ajouter_vues_totales(cursor, nombre))
+
+    @en_cache("vues_totales")
     def get_vues_totales(self):
-        """Récupère le nombre total de vues du site"""
+        """Récupère le nombre total de vues du site (somme des shards)"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT nombre_vues FROM vues_totales WHERE id = 1")
+        cursor.execute("SELECT COALESCE(SUM(nombre_vues), 0) FROM vues_totales_shards")
         result = cursor.fetchone()
         conn.close()
-        return result[0] if result else 0
+        return result[0]
+
+    @en_cache("vues_totales", ttl=60)
+    def get_vues_totales_par_jour(self, date_debut=None, date_fin=None):
+        """Récupère l'historique des vues totales : liste de (jour, nombre_vues)"""
+        conditions, params = _conditions_periode("jour", False, date_debut, date_fin)
+        query = "SELECT jour, SUM(nombre_vues) FROM vues_totales_shards"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        query += " GROUP BY jour ORDER BY jour"
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        result = cursor.fetchall()
+        conn.close()
+        return result
+
+    def _upsert_vues_pages(self, cursor, vues_pages):
+        """
+        Ajoute des vues (nom_page, categorie, nombre[, date_vue]) en une seule
+        instruction par ligne
+
+        date_vue (AAAA-MM-JJ HH:MM:SS, UTC) permet le rattrapage d'historique :
+        les agrégats horaires/journaliers sont alimentés à cette date et la
+        date de dernière vue n'est jamais reculée.
+        """
+        vues_pages = [
+            (nom_page, categorie, nombre, date_vue[0] if date_vue else None)
+            for nom_page, categorie, nombre, *date_vue in vues_pages
+        ]
+        cursor.executemany(
+            """
+            INSERT INTO vues_pages (nom_page, categorie, nombre_vues, date_derniere_vue)
+            VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ON CONFLICT (nom_page, categorie) DO UPDATE
+            SET nombre_vues = nombre_vues + excluded.nombre_vues,
+                date_derniere_vue = MAX(
+                    COALESCE(date_derniere_vue, ''), excluded.date_derniere_vue
+                )
+        """,
+            vues_pages,
+        )
+        cursor.executemany(
+            """
+            INSERT INTO evenements_pages (nom_page, categorie, nombre, date_vue)
+            VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        """,
+            vues_pages,
+        )
+
+    def add_vue_page(self, nom_page, categorie, nombre=1, date_vue=None):
+        """Ajoute ou met à jour une vue de page (ou `nombre` vues pré-agrégées)"""
+        self.add_vues_pages([(nom_page, categorie, nombre, date_vue)])
+
+    @invalide_cache("vues_pages")
+    def add_vues_pages(self, vues_pages):
+        """Ajoute en une transaction des vues de pages (nom_page, categorie, nombre[, date_vue])"""
+        vues_pages = list(vues_pages)
+        self._ecrire(lambda cursor: self._upsert_vues_pages(cursor, vues_pages))
+
+    @en_cache("vues_pages")
+    def get_vues_pages(self):
+        """Récupère toutes les vues par page"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT nom_page, categorie, nombre_vues, date_derniere_vue FROM vues_pages ORDER BY nombre_vues DESC"
+        )
+        result = cursor.fetchall()
+        conn.close()
+        return result
+
+    @invalide_cache("visiteurs")
+    def add_visiteur(
+        self, type_visiteur, temps_sejour, tranche_age, type_personna, date_visite=None
+    ):
+        """Ajoute un nouveau visiteur (date_visite : rattrapage, sinon maintenant)"""
+        (codes,) = self._encoder(
+            [(type_visiteur, temps_sejour, tranche_age, type_personna)]
+        )
+        self._ecrire(
+            lambda cursor: cursor.execute(
+                """
+                INSERT INTO visiteurs (type_visiteur, temps_sejour, tranche_age, type_personna, date_visite)
+                VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """,
+                codes + (date_visite,),
+            )
+        )
 
-    def add_vue_page(self, nom_page, categorie):
-        """Ajoute ou met à jour une vue de page"""
+    def get_visiteurs(self):
+        """Récupère tous les visiteurs"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        cursor.execute("SELECT * FROM visiteurs ORDER BY date_visite DESC")
+        result = cursor.fetchall()
+        conn.close()
+        return [self._decoder(ligne, 1, 5) for ligne in result]
+
+    def _visiteurs_conditions(
+        self,
+        type_visiteur=None,
+        temps_sejour=None,
+        tranche_age=None,
+        type_personna=None,
+        date_debut=None,
+        date_fin=None,
+    ):
+        """Construit les conditions SQL de filtrage des visiteurs ("Tous" = pas de filtre)"""
+        conditions = []
+        params = []
+
+        for colonne, valeur in (
+            ("type_visiteur", type_visiteur),
+            ("temps_sejour", temps_sejour),
+            ("tranche_age", tranche_age),
+            ("type_personna", type_personna),
+        ):
+            if valeur and valeur != "Tous":
+                # Un libellé jamais enregistré (code None) ne correspond à aucun visiteur
+                conditions.append(f"{colonne} = ?")
+                params.append(self._code(colonne, valeur))
+
+        conditions_dates, params_dates = _conditions_periode(
+            "date_visite", True, date_debut, date_fin
+        )
+        return conditions + conditions_dates, params + params_dates
+
+    @en_cache("visiteurs")
+    def get_visiteurs_page(
+        self,
+        limit=100,
+        type_visiteur=None,
+        temps_sejour=None,
+        tranche_age=None,
+        type_personna=None,
+        date_debut=None,
+        date_fin=None,
+        apres=None,
+    ):
+        """
+        Récupère une page de visiteurs, du plus récent au plus ancien
 
-        # Vérifier si la page existe déjà
-        cursor.execute(
-            "SELECT id FROM vues_pages WHERE nom_page = ? AND categorie = ?",
-            (nom_page, categorie),
+        `apres` est le couple (date_visite, id) du dernier visiteur de la page
+        précédente : la pagination par curseur parcourt l'index
+        (date_visite, id) sans relire les pages précédentes.
+        """
+        conditions, params = self._visiteurs_conditions(
+            type_visiteur,
+            temps_sejour,
+            tranche_age,
+            type_personna,
+            date_debut,
+            date_fin,
         )
-        existing = cursor.fetchone()
-
-        if existing:
-            cursor.execute(
-                """
-                UPDATE vues_pages 
-                SET nombre_vues = nombre_vues + 1, date_derniere_vue = CURRENT_TIMESTAMP 
-                WHERE nom_page = ? AND categorie = ?
-            """,
-                (nom_page, categorie),
-            )
-        else:
-            cursor.execute(
-                """
-                INSERT INTO vues_pages (nom_page, categorie, nombre_vues) 
-                VALUES (?, ?, 1)
-            """,
-                (nom_page, categorie),
-            )
+        if apres:
+            conditions.append("(date_visite, id) < (?, ?)")
+            params.extend(apres)
 
-        conn.commit()
-        conn.close()
+        query = "SELECT * FROM visiteurs"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        query += " ORDER BY date_visite DESC, id DESC LIMIT ?"
+        params.append(limit)
 
-    def get_vues_pages(self):
-        """Récupère toutes les vues par page"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            "SELECT nom_page, categorie, nombre_vues, date_derniere_vue FROM vues_pages ORDER BY nombre_vues DESC"
-        )
+        cursor.execute(query, params)
         result = cursor.fetchall()
         conn.close()
-        return result
+        return [self._decoder(ligne, 1, 5) for ligne in result]
 
-    def add_visiteur(self, type_visiteur, temps_sejour, tranche_age, type_personna):
-        """Ajoute un nouveau visiteur"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO visiteurs (type_visiteur, temps_sejour, tranche_age, type_personna) 
-            VALUES (?, ?, ?, ?)
-        """,
-            (type_visiteur, temps_sejour, tranche_age, type_personna),
+    def iter_visiteurs(
+        self,
+        type_visiteur=None,
+        temps_sejour=None,
+        tranche_age=None,
+        type_personna=None,
+        date_debut=None,
+        date_fin=None,
+        taille_lot=1000,
+    ):
+        """
+        Parcourt les visiteurs filtrés par lots, sans les charger tous en mémoire
+
+        Générateur de listes d'au plus `taille_lot` visiteurs décodés, du plus
+        récent au plus ancien.
+        """
+        conditions, params = self._visiteurs_conditions(
+            type_visiteur,
+            temps_sejour,
+            tranche_age,
+            type_personna,
+            date_debut,
+            date_fin,
         )
-        conn.commit()
-        conn.close()
+        query = "SELECT * FROM visiteurs"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        query += " ORDER BY date_visite DESC, id DESC"
+
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                lot = cursor.fetchmany(taille_lot)
+                if not lot:
+                    break
+                yield [self._decoder(ligne, 1, 5) for ligne in lot]
+        finally:
+            conn.close()
+
+    @en_cache("visiteurs", ttl=60)
+    def get_stats_visiteurs(self, date_debut=None, date_fin=None, croisements=()):
+        """
+        Récupère les statistiques des visiteurs
+
+        Les quatre répartitions (et les tableaux croisés demandés dans
+        `croisements`, ex. [("tranche_age", "type_visiteur")]) sont calculées
+        à partir d'une seule lecture du cube des visiteurs ; la période est
+        donc exprimée en jours.
+        """
+        for croisement in croisements:
+            for dimension in croisement:
+                if dimension not in DIMENSIONS_VISITEURS:
+                    raise ValueError(f"Dimension inconnue: {dimension}")
+
+        groupes = self.get_cube_visiteurs(DIMENSIONS_VISITEURS, date_debut, date_fin)
+        return self._agreger_stats(groupes, croisements)
+
+    @en_cache("visiteurs", ttl=60)
+    def get_cube_visiteurs(self, dimensions=(), date_debut=None, date_fin=None):
+        """
+        Agrège le cube des visiteurs sur les dimensions demandées
+
+        Retourne des tuples (valeur de chaque dimension..., nombre) ; sans
+        dimension, un seul tuple (nombre total,). Les bornes de dates sont
+        des jours AAAA-MM-JJ (l'heure éventuelle est ignorée).
+        """
+        for dimension in dimensions:
+            if dimension not in DIMENSIONS_VISITEURS:
+                raise ValueError(f"Dimension inconnue: {dimension}")
+
+        conditions = []
+        params = []
+        if date_debut:
+            conditions.append("jour >= ?")
+            params.append(str(date_debut)[:10])
+        if date_fin:
+            conditions.append("jour <= ?")
+            params.append(str(date_fin)[:10])
+
+        colonnes = ", ".join(dimensions)
+        if dimensions:
+            query = f"SELECT {colonnes}, SUM(nombre) FROM cube_visiteurs"
+        else:
+            query = "SELECT COALESCE(SUM(nombre), 0) FROM cube_visiteurs"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        if dimensions:
+            query += f" GROUP BY {colonnes}"
 
-    def get_visiteurs(self):
-        """Récupère tous les visiteurs"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM visiteurs ORDER BY date_visite DESC")
+        cursor.execute(query, params)
         result = cursor.fetchall()
         conn.close()
-        return result
+        return sorted(self._decoder(ligne, 0, len(dimensions)) for ligne in result)
 
-    def get_stats_visiteurs(self):
-        """Récupère les statistiques des visiteurs"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _agreger_stats(self, groupes, croisements=()):
+        """Déduit répartitions et tableaux croisés de comptes par combinaison de dimensions"""
+        marges = {dimension: {} for dimension in DIMENSIONS_VISITEURS}
+        tableaux = {tuple(croisement): {} for croisement in croisements}
+        positions = {d: i for i, d in enumerate(DIMENSIONS_VISITEURS)}
 
-        # Statistiques par type de visiteur
-        cursor.execute(
-            "SELECT type_visiteur, COUNT(*) FROM visiteurs GROUP BY type_visiteur"
-        )
-        stats_type = cursor.fetchall()
+        for groupe in groupes:
+            nombre = groupe[-1]
+            for i, dimension in enumerate(DIMENSIONS_VISITEURS):
+                valeurs = marges[dimension]
+                valeurs[groupe[i]] = valeurs.get(groupe[i], 0) + nombre
+            for (lignes, colonnes), cellules in tableaux.items():
+                cle = (groupe[positions[lignes]], groupe[positions[colonnes]])
+                cellules[cle] = cellules.get(cle, 0) + nombre
 
-        # Statistiques par temps de séjour
-        cursor.execute(
-            "SELECT temps_sejour, COUNT(*) FROM visiteurs GROUP BY temps_sejour"
-        )
-        stats_sejour = cursor.fetchall()
+        stats = {
+            dimension: sorted(valeurs.items())
+            for dimension, valeurs in marges.items()
+        }
+        if croisements:
+            stats["croisements"] = {
+                croisement: [(l, c, n) for (l, c), n in sorted(cellules.items())]
+                for croisement, cellules in tableaux.items()
+            }
+        return stats
 
-        # Statistiques par tranche d'âge
-        cursor.execute(
-            "SELECT tranche_age, COUNT(*) FROM visiteurs GROUP BY tranche_age"
-        )
-        stats_age = cursor.fetchall()
+    def get_activite_depuis(self, dernier_visiteur=None, dernier_evenement=None):
+        """
+        Activité enregistrée depuis les derniers identifiants lus (flux /live)
 
-        # Statistiques par type de persona
-        cursor.execute(
-            "SELECT type_personna, COUNT(*) FROM visiteurs GROUP BY type_personna"
-        )
-        stats_personna = cursor.fetchall()
+        Retourne (dernier_visiteur, dernier_evenement, répartitions des
+        nouveaux visiteurs par dimension, vues ajoutées par (page, catégorie),
+        vues totales). Sans identifiants de départ, seules les positions
+        courantes et les vues totales sont lues.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM visiteurs")
+        max_visiteur = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM evenements_pages")
+        max_evenement = cursor.fetchone()[0]
+        cursor.execute("SELECT vues_totales FROM resume_statistiques WHERE id = 1")
+        ligne = cursor.fetchone()
+        vues_totales = ligne[0] if ligne else 0
 
+        groupes = []
+        pages = []
+        if dernier_visiteur is not None and max_visiteur > dernier_visiteur:
+            cursor.execute(
+                f"""
+                SELECT {", ".join(DIMENSIONS_VISITEURS)}, COUNT(*)
+                FROM visiteurs WHERE id > ? AND id <= ?
+                GROUP BY {", ".join(DIMENSIONS_VISITEURS)}
+            """,
+                (dernier_visiteur, max_visiteur),
+            )
+            groupes = cursor.fetchall()
+        if dernier_evenement is not None and max_evenement > dernier_evenement:
+            cursor.execute(
+                """
+                SELECT nom_page, categorie, SUM(nombre)
+                FROM evenements_pages WHERE id > ? AND id <= ?
+                GROUP BY nom_page, categorie
+            """,
+                (dernier_evenement, max_evenement),
+            )
+            pages = cursor.fetchall()
         conn.close()
-        return {
-            "type_visiteur": stats_type,
-            "temps_sejour": stats_sejour,
-            "tranche_age": stats_age,
-            "type_personna": stats_personna,
-        }
 
+        groupes = [self._decoder(g, 0, len(DIMENSIONS_VISITEURS)) for g in groupes]
+        return (
+            max_visiteur,
+            max_evenement,
+            self._agreger_stats(groupes),
+            pages,
+            vues_totales,
+        )
+
+    @invalide_cache("visiteurs")
     def delete_visiteur(self, visiteur_id):
         """Supprime un visiteur par son ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM visiteurs WHERE id = ?", (visiteur_id,))
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        rows_affected = self._ecrire(
+            lambda cursor: cursor.execute(
+                "DELETE FROM visiteurs WHERE id = ?", (visiteur_id,)
+            ).rowcount
+        )
         return rows_affected > 0
 
+    @invalide_cache("visiteurs")
     def update_visiteur(
         self, visiteur_id, type_visiteur, temps_sejour, tranche_age, type_personna
     ):
         """Met à jour un visiteur"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            UPDATE visiteurs 
-            SET type_visiteur = ?, temps_sejour = ?, tranche_age = ?, type_personna = ?
-            WHERE id = ?
-        """,
-            (type_visiteur, temps_sejour, tranche_age, type_personna, visiteur_id),
+        (codes,) = self._encoder(
+            [(type_visiteur, temps_sejour, tranche_age, type_personna)]
+        )
+        rows_affected = self._ecrire(
+            lambda cursor: cursor.execute(
+                """
+                UPDATE visiteurs
+                SET type_visiteur = ?, temps_sejour = ?, tranche_age = ?, type_personna = ?
+                WHERE id = ?
+            """,
+                codes + (visiteur_id,),
+            ).rowcount
         )
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
         return rows_affected > 0
 
     def get_visiteur_by_id(self, visiteur_id):
@@ -254,34 +1605,179 @@ class DatabaseManager:
         cursor.execute("SELECT * FROM visiteurs WHERE id = ?", (visiteur_id,))
         result = cursor.fetchone()
         conn.close()
-        return result
+        return self._decoder(result, 1, 5)
 
+    @invalide_cache("vues_pages")
     def delete_page(self, page_id):
         """Supprime une page par son ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM vues_pages WHERE id = ?", (page_id,))
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return rows_affected > 0
 
+        def operation(cursor):
+            cursor.execute(
+                """
+                DELETE FROM evenements_pages WHERE (nom_page, categorie) IN
+                    (SELECT nom_page, categorie FROM vues_pages WHERE id = ?)
+            """,
+                (page_id,),
+            )
+            cursor.execute("DELETE FROM vues_pages WHERE id = ?", (page_id,))
+            return cursor.rowcount
+
+        return self._ecrire(operation) > 0
+
+    @invalide_cache("vues_pages")
     def update_page(self, page_id, nom_page, categorie):
         """Met à jour une page"""
+
+        def operation(cursor):
+            cursor.execute(
+                "SELECT nom_page, categorie FROM vues_pages WHERE id = ?", (page_id,)
+            )
+            ancienne = cursor.fetchone()
+            if ancienne and ancienne != (nom_page, categorie):
+                # Reporter l'historique sur le nouveau nom
+                cursor.execute(
+                    """
+                    UPDATE evenements_pages SET nom_page = ?, categorie = ?
+                    WHERE nom_page = ? AND categorie = ?
+                """,
+                    (nom_page, categorie, ancienne[0], ancienne[1]),
+                )
+                self._rebuild_agregats_pages(cursor, [ancienne, (nom_page, categorie)])
+            try:
+                cursor.execute(
+                    """
+                    UPDATE vues_pages
+                    SET nom_page = ?, categorie = ?
+                    WHERE id = ?
+                """,
+                    (nom_page, categorie, page_id),
+                )
+            except sqlite3.IntegrityError:
+                # Une page porte déjà ce nom dans cette catégorie : fusionner les compteurs
+                cursor.execute(
+                    """
+                    UPDATE vues_pages
+                    SET nombre_vues = nombre_vues + (SELECT nombre_vues FROM vues_pages WHERE id = ?),
+                        date_derniere_vue = MAX(
+                            date_derniere_vue,
+                            (SELECT date_derniere_vue FROM vues_pages WHERE id = ?)
+                        )
+                    WHERE nom_page = ? AND categorie = ?
+                """,
+                    (page_id, page_id, nom_page, categorie),
+                )
+                cursor.execute("DELETE FROM vues_pages WHERE id = ?", (page_id,))
+            return cursor.rowcount
+
+        return self._ecrire(operation) > 0
+
+    def _rebuild_agregats_pages(self, cursor, pages):
+        """Recalcule depuis le journal les agrégats des pages (nom_page, categorie) données"""
+        for table, colonne, periode in (
+            ("vues_pages_horaires", "heure", "strftime('%Y-%m-%d %H:00:00', date_vue)"),
+            ("vues_pages_journalieres", "jour", "date(date_vue)"),
+        ):
+            cursor.executemany(
+                f"DELETE FROM {table} WHERE nom_page = ? AND categorie = ?", pages
+            )
+            cursor.executemany(
+                f"""
+                INSERT INTO {table} ({colonne}, nom_page, categorie, nombre_vues)
+                SELECT {periode}, nom_page, categorie, SUM(nombre)
+                FROM evenements_pages
+                WHERE nom_page = ? AND categorie = ?
+                GROUP BY 1, nom_page, categorie
+            """,
+                pages,
+            )
+
+    @en_cache("vues_pages", ttl=60)
+    def get_series_vues_pages(
+        self,
+        granularite="jour",
+        nom_page=None,
+        categorie=None,
+        date_debut=None,
+        date_fin=None,
+        grouper_par=None,
+    ):
+        """
+        Récupère l'évolution des vues de pages depuis les agrégats
+
+        granularite: "heure", "jour", "semaine" ou "mois" (semaines et mois
+        sont regroupés à partir des agrégats journaliers). grouper_par: None,
+        "nom_page" ou "categorie". Retourne des tuples (periode, nombre_vues)
+        ou (periode, groupe, nombre_vues) triés par période.
+        """
+        if grouper_par not in (None, "nom_page", "categorie"):
+            raise ValueError(f"Regroupement inconnu: {grouper_par}")
+        if granularite == "heure":
+            table, colonne = "vues_pages_horaires", "heure"
+        else:
+            table, colonne = "vues_pages_journalieres", "jour"
+        periode = _expression_periode(granularite, colonne)
+
+        conditions, params = _conditions_periode(
+            colonne, granularite == "heure", date_debut, date_fin
+        )
+        if nom_page:
+            conditions.append("nom_page = ?")
+            params.append(nom_page)
+        if categorie:
+            conditions.append("categorie = ?")
+            params.append(categorie)
+
+        colonnes = [periode] + ([grouper_par] if grouper_par else [])
+        query = f"SELECT {', '.join(colonnes)}, SUM(nombre_vues) FROM {table}"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        rangs = ", ".join(str(i + 1) for i in range(len(colonnes)))
+        query += f" GROUP BY {rangs} ORDER BY {rangs}"
+
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            """
-            UPDATE vues_pages 
-            SET nom_page = ?, categorie = ?
-            WHERE id = ?
-        """,
-            (nom_page, categorie, page_id),
+        cursor.execute(query, params)
+        result = cursor.fetchall()
+        conn.close()
+        return result
+
+    @en_cache("visiteurs", ttl=60)
+    def get_series_visiteurs(
+        self, granularite="jour", date_debut=None, date_fin=None, dimension=None
+    ):
+        """
+        Récupère l'évolution du nombre de visiteurs
+
+        Les granularités jour/semaine/mois sont lues dans le cube ; l'heure est
+        calculée sur la table des visiteurs via l'index sur date_visite.
+        Retourne des tuples (periode, nombre) ou (periode, valeur, nombre).
+        """
+        if dimension is not None and dimension not in DIMENSIONS_VISITEURS:
+            raise ValueError(f"Dimension inconnue: {dimension}")
+        if granularite == "heure":
+            table, colonne, nombre = "visiteurs", "date_visite", "COUNT(*)"
+        else:
+            table, colonne, nombre = "cube_visiteurs", "jour", "SUM(nombre)"
+        periode = _expression_periode(granularite, colonne)
+
+        conditions, params = _conditions_periode(
+            colonne, granularite == "heure", date_debut, date_fin
         )
-        rows_affected = cursor.rowcount
-        conn.commit()
+        colonnes = [periode] + ([dimension] if dimension else [])
+        query = f"SELECT {', '.join(colonnes)}, {nombre} FROM {table}"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        rangs = ", ".join(str(i + 1) for i in range(len(colonnes)))
+        query += f" GROUP BY {rangs} ORDER BY {rangs}"
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        result = cursor.fetchall()
         conn.close()
-        return rows_affected > 0
+        if dimension:
+            return [self._decoder(ligne, 1, 2) for ligne in result]
+        return result
 
     def get_page_by_id(self, page_id):
         """Récupère une page par son ID"""
@@ -292,6 +1788,7 @@ class DatabaseManager:
         conn.close()
         return result
 
+    @en_cache("vues_pages")
     def get_vues_pages_with_id(self):
         """Récupère toutes les vues par page avec les IDs"""
         conn = self.get_connection()
@@ -303,6 +1800,40 @@ class DatabaseManager:
         conn.close()
         return result
 
+    def iter_vues_pages(
+        self, categorie=None, date_debut=None, date_fin=None, taille_lot=1000
+    ):
+        """
+        Parcourt les pages par lots, filtrées par catégorie et date de dernière vue
+
+        Générateur de listes d'au plus `taille_lot` tuples
+        (id, nom_page, categorie, nombre_vues, date_derniere_vue).
+        """
+        conditions, params = _conditions_periode(
+            "date_derniere_vue", True, date_debut, date_fin
+        )
+        if categorie:
+            conditions.append("categorie = ?")
+            params.append(categorie)
+
+        query = "SELECT id, nom_page, categorie, nombre_vues, date_derniere_vue FROM vues_pages"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        query += " ORDER BY nombre_vues DESC"
+
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                lot = cursor.fetchmany(taille_lot)
+                if not lot:
+                    break
+                yield lot
+        finally:
+            conn.close()
+
+    @invalide_cache("visiteurs")
     def delete_visiteurs_by_criteria(
         self,
         type_visiteur=None,
@@ -311,65 +1842,236 @@ class DatabaseManager:
         type_personna=None,
     ):
         """Supprime les visiteurs selon des critères spécifiques"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        conditions = []
-        params = []
-
-        if type_visiteur and type_visiteur != "Tous":
-            conditions.append("type_visiteur = ?")
-            params.append(type_visiteur)
-
-        if temps_sejour and temps_sejour != "Tous":
-            conditions.append("temps_sejour = ?")
-            params.append(temps_sejour)
-
-        if tranche_age and tranche_age != "Tous":
-            conditions.append("tranche_age = ?")
-            params.append(tranche_age)
-
-        if type_personna and type_personna != "Tous":
-            conditions.append("type_personna = ?")
-            params.append(type_personna)
+        conditions, params = self._visiteurs_conditions(
+            type_visiteur, temps_sejour, tranche_age, type_personna
+        )
 
         if conditions:
             query = f"DELETE FROM visiteurs WHERE {' AND '.join(conditions)}"
-            cursor.execute(query, params)
         else:
-            cursor.execute("DELETE FROM visiteurs")
+            query = "DELETE FROM visiteurs"
 
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return rows_affected
+        return self._ecrire(lambda cursor: cursor.execute(query, params).rowcount)
 
+    @invalide_cache("vues_pages")
     def delete_pages_by_categories(self, categories):
         """Supprime les pages selon les catégories spécifiées"""
         if not categories:
             return 0
 
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
         placeholders = ",".join(["?" for _ in categories])
-        query = f"DELETE FROM vues_pages WHERE categorie IN ({placeholders})"
-        cursor.execute(query, categories)
 
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return rows_affected
+        def operation(cursor):
+            cursor.execute(
+                f"DELETE FROM evenements_pages WHERE categorie IN ({placeholders})",
+                categories,
+            )
+            query = f"DELETE FROM vues_pages WHERE categorie IN ({placeholders})"
+            cursor.execute(query, categories)
+            return cursor.rowcount
+
+        return self._ecrire(operation)
 
+    @invalide_cache("visiteurs", "vues_pages", "vues_totales")
     def reset_all_data(self):
         """Remet à zéro toutes les données"""
+
+        def operation(cursor):
+            cursor.execute("DELETE FROM visiteurs")
+            cursor.execute("DELETE FROM cube_visiteurs")
+            cursor.execute("DELETE FROM vues_pages")
+            cursor.execute("DELETE FROM evenements_pages")
+            cursor.execute("DELETE FROM vues_pages_horaires")
+            cursor.execute("DELETE FROM vues_pages_journalieres")
+            cursor.execute("DELETE FROM vues_totales_shards")
+
+        self._ecrire(operation)
+        return True
+
+    @invalide_cache("visiteurs", "vues_pages", "vues_totales")
+    def add_batch(self, visiteurs=(), vues_pages=(), vues_totales=0):
+        """Enregistre un lot d'événements dans une seule transaction"""
+        self._ecrire(self._operation_lot(visiteurs, vues_pages, vues_totales))
+
+    def _operation_lot(self, visiteurs=(), vues_pages=(), vues_totales=0):
+        """
+        Prépare l'écriture d'un lot d'événements et retourne operation(cursor)
+
+        Les visiteurs (4 libellés[, date_visite]) sont insérés en une seule
+        passe, les vues de pages (nom_page, categorie[, nombre[, date_vue]])
+        sont agrégées par page et par date avant la mise à jour et les vues
+        totales sont ajoutées en une seule fois.
+        """
+        compteurs_pages = {}
+        for nom_page, categorie, *reste in vues_pages:
+            nombre = reste[0] if reste else 1
+            cle = (nom_page, categorie, reste[1] if len(reste) > 1 else None)
+            compteurs_pages[cle] = compteurs_pages.get(cle, 0) + nombre
+        visiteurs = [tuple(v) for v in visiteurs]
+        codes = self._encoder([v[:4] for v in visiteurs])
+        visiteurs = [
+            c + (v[4] if len(v) > 4 else None,) for c, v in zip(codes, visiteurs)
+        ]
+
+        def operation(cursor):
+            cursor.executemany(
+                """
+                INSERT INTO visiteurs (type_visiteur, temps_sejour, tranche_age, type_personna, date_visite)
+                VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """,
+                visiteurs,
+            )
+
+            self._upsert_vues_pages(
+                cursor,
+                [
+                    (nom_page, categorie, nombre, date_vue)
+                    for (nom_page, categorie, date_vue), nombre in compteurs_pages.items()
+                ],
+            )
+
+            if vues_totales:
+                self._ajouter_vues_totales(cursor, vues_totales)
+
+        return operation
+
+    @invalide_cache("visiteurs", "vues_pages", "vues_totales")
+    def add_batch_idempotent(self, cle_lot=None, visiteurs=(), vues_pages=(), vues_totales=0):
+        """
+        Enregistre un lot en écartant les identifiants déjà ingérés
+
+        `visiteurs` et `vues_pages` sont des listes de (clé ou None, événement).
+        Les clés sont insérées dans identifiants_ingestion dans la même
+        transaction que les événements nouveaux. Retourne
+        {"lot": bool, "visiteurs": [index], "pages": [index]} des doublons.
+        """
+        return self._ecrire(
+            self._operation_lot_idempotent(cle_lot, visiteurs, vues_pages, vues_totales)
+        )
+
+    def _operation_lot_idempotent(
+        self, cle_lot=None, visiteurs=(), vues_pages=(), vues_totales=0
+    ):
+        """Prépare l'écriture d'un lot idempotent et retourne operation(cursor) -> doublons"""
+        visiteurs = list(visiteurs)
+        vues_pages = list(vues_pages)
+        # Les modalités doivent exister avant la transaction (voir _encoder)
+        self._encoder([v[:4] for _, v in visiteurs])
+
+        def operation(cursor):
+            def nouvelle(cle):
+                if cle is None:
+                    return True
+                cursor.execute(
+                    "INSERT OR IGNORE INTO identifiants_ingestion (cle) VALUES (?)",
+                    (cle,),
+                )
+                return cursor.rowcount == 1
+
+            if cle_lot is not None and not nouvelle(cle_lot):
+                return {
+                    "lot": True,
+                    "visiteurs": list(range(len(visiteurs))),
+                    "pages": list(range(len(vues_pages))),
+                }
+            doublons = {"lot": False, "visiteurs": [], "pages": []}
+            nouveaux = {"visiteurs": [], "pages": []}
+            for nom, evenements in (("visiteurs", visiteurs), ("pages", vues_pages)):
+                for index, (cle, evenement) in enumerate(evenements):
+                    if nouvelle(cle):
+                        nouveaux[nom].append(evenement)
+                    else:
+                        doublons[nom].append(index)
+            self._operation_lot(nouveaux["visiteurs"], nouveaux["pages"], vues_totales)(
+                cursor
+            )
+            return doublons
+
+        return operation
+
+    def get_identifiants_ingestion(self, cles):
+        """Retourne, parmi `cles`, les identifiants déjà ingérés"""
+        cles = list(cles)
+        connues = set()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        for debut in range(0, len(cles), 500):
+            lot = cles[debut : debut + 500]
+            placeholders = ",".join("?" for _ in lot)
+            cursor.execute(
+                f"SELECT cle FROM identifiants_ingestion WHERE cle IN ({placeholders})",
+                lot,
+            )
+            connues.update(cle for (cle,) in cursor.fetchall())
+        conn.close()
+        return connues
+
+    def get_identifiants_ingestion_recents(self, secondes):
+        """Identifiants ingérés depuis `secondes` secondes"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        cursor.execute(
+            "SELECT cle FROM identifiants_ingestion WHERE date_reception >= datetime('now', ?)",
+            (f"-{int(secondes)} seconds",),
+        )
+        result = [cle for (cle,) in cursor.fetchall()]
+        conn.close()
+        return result
 
-        cursor.execute("DELETE FROM visiteurs")
-        cursor.execute("DELETE FROM vues_pages")
-        cursor.execute("UPDATE vues_totales SET nombre_vues = 0, date = CURRENT_DATE")
+    def purger_identifiants_ingestion(self, jours):
+        """Supprime les identifiants ingérés il y a plus de `jours` jours"""
+        return self._ecrire(
+            lambda cursor: cursor.execute(
+                "DELETE FROM identifiants_ingestion WHERE date_reception < datetime('now', ?)",
+                (f"-{int(jours)} days",),
+            ).rowcount
+        )
 
-        conn.commit()
+    @invalide_cache("visiteurs", "vues_pages", "vues_totales")
+    def appliquer_segments(
+        self, segments, visiteurs=(), vues_pages=(), vues_totales=0, lots_idempotents=()
+    ):
+        """
+        Applique les événements de segments du spool dans une seule transaction
+
+        `segments` est une liste de (nom, nombre_evenements). Les noms sont
+        enregistrés dans segments_appliques avec les événements : un segment
+        déjà appliqué fait échouer la transaction entière (IntegrityError).
+        `lots_idempotents` contient des (clé du lot, visiteurs, vues_pages,
+        vues_totales) au format de add_batch_idempotent, dédupliqués dans la
+        même transaction. Retourne le nombre d'éléments écartés comme doublons.
+        """
+        ecrire_lot = self._operation_lot(visiteurs, vues_pages, vues_totales)
+        ecrire_lots_idempotents = [
+            self._operation_lot_idempotent(*lot) for lot in lots_idempotents
+        ]
+
+        def operation(cursor):
+            cursor.executemany(
+                "INSERT INTO segments_appliques (nom, nombre_evenements) VALUES (?, ?)",
+                segments,
+            )
+            ecrire_lot(cursor)
+            ecartes = 0
+            for ecrire in ecrire_lots_idempotents:
+                doublons = ecrire(cursor)
+                ecartes += len(doublons["visiteurs"]) + len(doublons["pages"])
+            return ecartes
+
+        return self._ecrire(operation)
+
+    def get_segments_appliques(self, noms):
+        """Retourne, parmi `noms`, ceux des segments déjà appliqués"""
+        noms = list(noms)
+        appliques = set()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        for debut in range(0, len(noms), 500):
+            lot = noms[debut : debut + 500]
+            placeholders = ",".join("?" for _ in lot)
+            cursor.execute(
+                f"SELECT nom FROM segments_appliques WHERE nom IN ({placeholders})", lot
+            )
+            appliques.update(nom for (nom,) in cursor.fetchall())
         conn.close()
-        return True
+        return appliques
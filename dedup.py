@@ -0,0 +1,220 @@
+"""
+Index de déduplication borné pour l'ingestion idempotente (/tracking/bulk)
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _cle(nature, identifiant):
+    """Clé d'un identifiant client, préfixée par le type d'élément (lot, visiteur, page)"""
+    return f"{nature}:{identifiant}" if identifiant is not None else None
+
+
+class BloomFenetre:
+    """
+    Filtre de Bloom à fenêtre glissante.
+
+    Deux générations de `capacite` éléments chacune : la génération courante
+    reçoit les ajouts et devient la précédente après `fenetre_s` secondes,
+    l'ancienne précédente étant oubliée. Un identifiant est donc reconnu
+    pendant au moins `fenetre_s` secondes, avec un taux de faux positifs
+    d'environ `taux_faux_positifs` ; jamais de faux négatif dans la fenêtre.
+    """
+
+    def __init__(self, capacite=1_000_000, taux_faux_positifs=0.001, fenetre_s=3600):
+        self.fenetre_s = fenetre_s
+        self.nombre_bits = max(
+            8, int(-capacite * math.log(taux_faux_positifs) / math.log(2) ** 2)
+        )
+        self.nombre_hachages = max(
+            1, round(self.nombre_bits / capacite * math.log(2))
+        )
+        self._courante = bytearray((self.nombre_bits + 7) // 8)
+        self._precedente = bytearray(len(self._courante))
+        self._debut = time.monotonic()
+
+    def _positions(self, cle):
+        empreinte = hashlib.blake2b(cle.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(empreinte[:8], "little")
+        h2 = int.from_bytes(empreinte[8:], "little") | 1
+        return [(h1 + i * h2) % self.nombre_bits for i in range(self.nombre_hachages)]
+
+    def _rotation(self):
+        if time.monotonic() - self._debut >= self.fenetre_s:
+            self._precedente = self._courante
+            self._courante = bytearray(len(self._precedente))
+            self._debut = time.monotonic()
+
+    def ajouter(self, cle):
+        self._rotation()
+        for position in self._positions(cle):
+            self._courante[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, cle):
+        self._rotation()
+        positions = self._positions(cle)
+        return any(
+            all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+            for bits in (self._courante, self._precedente)
+        )
+
+
+class DedupIndex:
+    """
+    Déduplication des lots et événements rejoués par les clients.
+
+    Un identifiant est d'abord cherché dans un LRU des identifiants récents,
+    puis dans un filtre de Bloom à fenêtre : s'il n'y figure pas, il est
+    nouveau sans lecture de la base ; sinon la table identifiants_ingestion
+    tranche. Elle reste l'autorité : les identifiants y sont insérés dans la
+    transaction qui écrit les événements, ce qui écarte aussi les rejeux
+    concurrents ou plus anciens que la fenêtre. Les identifiants de plus de
+    `retention_jours` jours sont purgés.
+
+    Les clés sont préfixées par le type d'élément : un visiteur et une page
+    peuvent porter le même identifiant client sans s'écarter l'un l'autre.
+    """
+
+    def __init__(
+        self,
+        db,
+        taille_lru=100_000,
+        capacite_bloom=1_000_000,
+        fenetre_s=3600,
+        retention_jours=7,
+    ):
+        self.db = db
+        self.taille_lru = taille_lru
+        self.retention_jours = retention_jours
+        self._recents = OrderedDict()
+        self._bloom = BloomFenetre(capacite_bloom, fenetre_s=fenetre_s)
+        self._lock = threading.Lock()
+        self._derniere_purge = time.monotonic()
+        self.stats = {
+            "identifiants_vus": 0,
+            "doublons": 0,
+            "trouves_lru": 0,
+            "ecartes_bloom": 0,
+            "lectures_base": 0,
+        }
+        for cle in db.get_identifiants_ingestion_recents(fenetre_s):
+            self._bloom.ajouter(cle)
+
+    def ajouter_lot(
+        self, id_lot=None, visiteurs=(), vues_pages=(), vues_totales=0, spool=None
+    ):
+        """
+        Enregistre un lot /tracking/bulk en écartant les rejeux
+
+        `visiteurs` et `vues_pages` sont des listes de (id ou None, événement).
+        Retourne {"lot": bool, "visiteurs": [index], "pages": [index]} : le
+        lot entier est un doublon, ou les index des événements écartés.
+
+        Les vues totales n'ont pas d'identifiant : elles exigent `id_lot`,
+        sans quoi chaque rejeu les compterait à nouveau (ValueError).
+
+        Avec un `spool` (spool.SpoolWriter), le lot est ajouté au spool avec
+        ses clés et le compacteur écarte les rejeux dans sa transaction ; les
+        doublons signalés sont alors ceux déjà connus de l'index.
+        """
+        if vues_totales and id_lot is None:
+            raise ValueError("vues_totales exige un batch_id dans un lot idempotent")
+        cle_lot = _cle("lot", id_lot)
+        visiteurs = [(_cle("visiteur", i), v) for i, v in visiteurs]
+        vues_pages = [(_cle("page", i), p) for i, p in vues_pages]
+        cles = [c for c, _ in visiteurs + vues_pages if c is not None]
+        if cle_lot is not None:
+            cles.append(cle_lot)
+        connues = self._connues(cles)
+
+        if cle_lot in connues or (
+            cle_lot is None and all(c in connues for c, _ in visiteurs + vues_pages)
+        ):
+            # Rejeu complet : rien à écrire
+            doublons = {
+                "lot": cle_lot in connues,
+                "visiteurs": list(range(len(visiteurs))),
+                "pages": list(range(len(vues_pages))),
+            }
+        elif spool is not None and self._ajouter_au_spool(
+            spool, cle_lot, visiteurs, vues_pages, vues_totales, connues
+        ):
+            doublons = {
+                "lot": False,
+                "visiteurs": [i for i, (c, _) in enumerate(visiteurs) if c in connues],
+                "pages": [i for i, (c, _) in enumerate(vues_pages) if c in connues],
+            }
+        else:
+            doublons = self.db.add_batch_idempotent(
+                cle_lot, visiteurs, vues_pages, vues_totales
+            )
+
+        self._retenir(cles)
+        with self._lock:
+            self.stats["identifiants_vus"] += len(cles)
+            self.stats["doublons"] += (
+                len(doublons["visiteurs"]) + len(doublons["pages"]) + doublons["lot"]
+            )
+        self._purger()
+        return doublons
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "lru": len(self._recents)}
+
+    @staticmethod
+    def _ajouter_au_spool(spool, cle_lot, visiteurs, vues_pages, vues_totales, connues):
+        """Ajoute au spool les éléments non encore connus, avec leurs clés"""
+        return spool.submit_lot_idempotent(
+            cle_lot,
+            [(c, v) for c, v in visiteurs if c not in connues],
+            [(c, p) for c, p in vues_pages if c not in connues],
+            vues_totales,
+        )
+
+    def _connues(self, cles):
+        """Identifiants déjà enregistrés parmi `cles` (LRU, Bloom puis base)"""
+        connues = set()
+        a_verifier = []
+        with self._lock:
+            for cle in cles:
+                if cle in self._recents:
+                    self._recents.move_to_end(cle)
+                    connues.add(cle)
+                    self.stats["trouves_lru"] += 1
+                elif cle in self._bloom:
+                    a_verifier.append(cle)
+                else:
+                    self.stats["ecartes_bloom"] += 1
+        if a_verifier:
+            connues |= self.db.get_identifiants_ingestion(a_verifier)
+            with self._lock:
+                self.stats["lectures_base"] += 1
+        return connues
+
+    def _retenir(self, cles):
+        with self._lock:
+            for cle in cles:
+                self._recents[cle] = True
+                self._recents.move_to_end(cle)
+                self._bloom.ajouter(cle)
+            while len(self._recents) > self.taille_lru:
+                self._recents.popitem(last=False)
+
+    def _purger(self):
+        """Purge les identifiants expirés de la base, au plus une fois par heure"""
+        with self._lock:
+            if time.monotonic() - self._derniere_purge < 3600:
+                return
+            self._derniere_purge = time.monotonic()
+        try:
+            self.db.purger_identifiants_ingestion(self.retention_jours)
+        except Exception as e:
+            logger.error("Erreur lors de la purge des identifiants d'ingestion: %s", e)
@@ -37,10 +37,12 @@ def generate_sample_data():
 
     # Ajouter des vues pour les pages (entre 5 et 50 vues par page)
     print("Ajout des vues de pages...")
-    for nom_page, categorie in pages_data:
-        nombre_vues = random.randint(5, 50)
-        for _ in range(nombre_vues):
-            db.add_vue_page(nom_page, categorie)
+    db.add_vues_pages(
+        [
+            (nom_page, categorie, random.randint(5, 50))
+            for nom_page, categorie in pages_data
+        ]
+    )
 
     # Types de visiteurs avec leurs probabilités
     types_visiteurs = ["Couple", "Famille", "Solitaire"]
@@ -0,0 +1,198 @@
+"""
+File d'ingestion en écriture différée (write-behind) pour les endpoints de tracking
+"""
+
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionQueue:
+    """
+    Met en file les événements de tracking et les écrit par lots.
+
+    Un thread d'arrière-plan vide la file et enregistre les événements dans une
+    seule transaction dès que `batch_size` événements sont en attente ou que
+    `flush_interval_ms` millisecondes se sont écoulées depuis le dernier lot.
+
+    Un lot dont l'écriture échoue (base verrouillée...) est réessayé jusqu'à
+    `max_tentatives` fois avec un délai exponentiel ; au-delà, ses événements
+    sont comptés dans "evenements_perdus".
+    """
+
+    def __init__(
+        self,
+        db,
+        batch_size=500,
+        flush_interval_ms=200,
+        max_size=100000,
+        max_tentatives=5,
+        attente_initiale=0.2,
+        attente_max=5.0,
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_tentatives = max_tentatives
+        self.attente_initiale = attente_initiale
+        self.attente_max = attente_max
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self.stats = {
+            "evenements_recus": 0,
+            "evenements_ecrits": 0,
+            "evenements_refuses": 0,
+            "lots_ecrits": 0,
+            "erreurs": 0,
+            "reessais": 0,
+            "evenements_perdus": 0,
+        }
+
+    def start(self):
+        """Démarre le thread d'écriture"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="ingestion-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Arrête le thread d'écriture et écrit les événements restants"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        # Écrire ce qui reste (thread absent ou arrêté avant la fin)
+        self.flush()
+
+    def submit(self, event):
+        """
+        Ajoute un événement à la file.
+
+        Retourne False si la file est pleine : l'appelant doit alors écrire
+        l'événement directement.
+        """
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._compter(evenements_refuses=1)
+            return False
+        self._compter(evenements_recus=1)
+        return True
+
+    def submit_visiteur(
+        self, type_visiteur, temps_sejour, tranche_age, type_personna, date_visite=None
+    ):
+        return self.submit(
+            (
+                "visiteur",
+                (type_visiteur, temps_sejour, tranche_age, type_personna, date_visite),
+            )
+        )
+
+    def submit_vue_page(self, nom_page, categorie, nombre=1, date_vue=None):
+        return self.submit(("page", (nom_page, categorie, nombre, date_vue)))
+
+    def submit_vue_totale(self):
+        return self.submit(("vue_totale", 1))
+
+    def submit_batch(self, visiteurs=(), vues_pages=(), vues_totales=0):
+        return self.submit(("lot", (list(visiteurs), list(vues_pages), vues_totales)))
+
+    def flush(self):
+        """Écrit immédiatement tous les événements en attente"""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def get_stats(self):
+        """Retourne les compteurs de la file"""
+        with self._stats_lock:
+            return {**self.stats, "en_attente": self._queue.qsize()}
+
+    def _compter(self, **increments):
+        with self._stats_lock:
+            for cle, valeur in increments.items():
+                self.stats[cle] += valeur
+
+    def _drain(self, limit, timeout=None):
+        batch = []
+        deadline = time.monotonic() + timeout if timeout else None
+        while len(batch) < limit:
+            try:
+                if deadline is None:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        visiteurs = []
+        vues_pages = []
+        vues_totales = 0
+        for kind, payload in batch:
+            if kind == "visiteur":
+                visiteurs.append(payload)
+            elif kind == "page":
+                vues_pages.append(payload)
+            elif kind == "vue_totale":
+                vues_totales += payload
+            elif kind == "lot":
+                visiteurs += payload[0]
+                vues_pages += payload[1]
+                vues_totales += payload[2]
+
+        # Un seul thread écrit à la fois (thread de fond ou flush à l'arrêt)
+        with self._lock:
+            for tentative in range(1, self.max_tentatives + 1):
+                try:
+                    self.db.add_batch(visiteurs, vues_pages, vues_totales)
+                except Exception as e:
+                    self._compter(erreurs=1)
+                    if tentative == self.max_tentatives:
+                        self._compter(evenements_perdus=len(batch))
+                        logger.error(
+                            "Lot de %d événements abandonné après %d tentatives: %s",
+                            len(batch),
+                            tentative,
+                            e,
+                        )
+                        return
+                    attente = min(
+                        self.attente_max, self.attente_initiale * 2 ** (tentative - 1)
+                    )
+                    logger.warning(
+                        "Échec de l'écriture d'un lot de %d événements "
+                        "(tentative %d/%d, nouvel essai dans %.1fs): %s",
+                        len(batch),
+                        tentative,
+                        self.max_tentatives,
+                        attente,
+                        e,
+                    )
+                    self._compter(reessais=1)
+                    time.sleep(attente)
+                    continue
+                self._compter(evenements_ecrits=len(batch), lots_ecrits=1)
+                return
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._drain(self.batch_size, timeout=self.flush_interval)
+            if batch:
+                self._write(batch)
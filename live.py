@@ -0,0 +1,99 @@
+"""
+Diffusion en direct de l'activité de tracking (flux SSE de l'API)
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from database import DIMENSIONS_VISITEURS
+
+logger = logging.getLogger(__name__)
+
+
+class LiveBroadcaster:
+    """
+    Calcule une fois par intervalle l'activité récente et la diffuse aux abonnés.
+
+    Tant qu'il y a au moins un abonné, une seule tâche lit toutes les
+    `intervalle` secondes les visiteurs et vues de pages enregistrés depuis la
+    lecture précédente (quel que soit le processus qui les a écrits) et place
+    le même delta dans la file de chaque abonné : N abonnés coûtent une seule
+    agrégation. Un abonné trop lent perd les deltas les plus anciens, le
+    total courant reste exact.
+    """
+
+    def __init__(self, adb, intervalle=1.0, taille_file=30, max_abonnes=1000):
+        self.adb = adb
+        self.intervalle = intervalle
+        self.taille_file = taille_file
+        self.max_abonnes = max_abonnes
+        self._abonnes = set()
+        self._tache = None
+        self.stats = {"deltas_diffuses": 0, "deltas_perdus": 0, "erreurs": 0}
+
+    def abonner(self):
+        """Retourne la file d'un nouvel abonné, ou None si la limite est atteinte"""
+        if len(self._abonnes) >= self.max_abonnes:
+            return None
+        file = asyncio.Queue(maxsize=self.taille_file)
+        self._abonnes.add(file)
+        if self._tache is None or self._tache.done():
+            self._tache = asyncio.get_running_loop().create_task(self._diffuser())
+        return file
+
+    def desabonner(self, file):
+        self._abonnes.discard(file)
+
+    def get_stats(self):
+        return {**self.stats, "abonnes": len(self._abonnes)}
+
+    async def _diffuser(self):
+        positions = None  # (dernier visiteur, dernier événement de page) lus
+        total = 0
+        while self._abonnes:
+            try:
+                (
+                    dernier_visiteur,
+                    dernier_evenement,
+                    repartitions,
+                    pages,
+                    vues_totales,
+                ) = await self.adb.get_activite_depuis(*(positions or ()))
+            except Exception as e:
+                self.stats["erreurs"] += 1
+                logger.error("Erreur lors du calcul du flux en direct: %s", e)
+                await asyncio.sleep(self.intervalle)
+                continue
+            premiere_lecture = positions is None
+            positions = (dernier_visiteur, dernier_evenement)
+            if not premiere_lecture:
+                self._publier(
+                    {
+                        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                        "nouveaux_visiteurs": sum(
+                            n for _, n in repartitions[DIMENSIONS_VISITEURS[0]]
+                        ),
+                        "visiteurs": {
+                            dimension: dict(valeurs)
+                            for dimension, valeurs in repartitions.items()
+                            if valeurs
+                        },
+                        "pages": [
+                            {"nom_page": nom_page, "categorie": categorie, "vues": vues}
+                            for nom_page, categorie, vues in pages
+                        ],
+                        "vues_totales_ajoutees": vues_totales - total,
+                        "vues_totales": vues_totales,
+                    }
+                )
+            total = vues_totales
+            await asyncio.sleep(self.intervalle)
+
+    def _publier(self, delta):
+        for file in list(self._abonnes):
+            if file.full():
+                file.get_nowait()
+                self.stats["deltas_perdus"] += 1
+            file.put_nowait(delta)
+        self.stats["deltas_diffuses"] += 1
@@ -3,37 +3,44 @@ Utilitaires de maintenance pour l'application Tourisme Castagniccia Casinca
 """
 
 from database import DatabaseManager
-import sqlite3
-import pandas as pd
+from backup_manager import BackupManager
+import csv
+import os
 from datetime import datetime
 
 
 class MaintenanceTools:
     def __init__(self):
         self.db = DatabaseManager()
+        self.backups = BackupManager(self.db.db_path)
 
     def export_all_data(self, filename=None):
         """Exporte toutes les données en CSV"""
         if not filename:
             filename = f"export_complet_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
 
-        # Récupérer toutes les données des visiteurs
-        visiteurs = self.db.get_visiteurs()
-        if visiteurs:
-            df = pd.DataFrame(
-                visiteurs,
-                columns=[
+        # Écrire les visiteurs lot par lot, sans les charger tous en mémoire
+        nombre = 0
+        with open(filename, "w", newline="", encoding="utf-8") as fichier:
+            writer = csv.writer(fichier)
+            writer.writerow(
+                [
                     "ID",
                     "Type Visiteur",
                     "Temps Séjour",
                     "Tranche Âge",
                     "Centres d'intérêt",
                     "Date Visite",
-                ],
+                ]
             )
-            df.to_csv(filename, index=False)
+            for lot in self.db.iter_visiteurs():
+                writer.writerows(lot)
+                nombre += len(lot)
+
+        if nombre:
             print(f"Données exportées vers {filename}")
         else:
+            os.remove(filename)
             print(" Aucune donnée à exporter")
 
     def reset_database(self):
@@ -42,16 +49,8 @@ class MaintenanceTools:
             " Êtes-vous sûr de vouloir réinitialiser la base de données ? (oui/non): "
         )
         if confirm.lower() == "oui":
-            conn = self.db.get_connection()
-            cursor = conn.cursor()
-
-            # Supprimer toutes les données
-            cursor.execute("DELETE FROM visiteurs")
-            cursor.execute("DELETE FROM vues_pages")
-            cursor.execute("UPDATE vues_totales SET nombre_vues = 0")
-
-            conn.commit()
-            conn.close()
+            # Même remise à zéro que l'application (historique et agrégats compris)
+            self.db.reset_all_data()
             print("Base de données réinitialisée")
         else:
             print(" Réinitialisation annulée")
@@ -87,17 +86,13 @@ class MaintenanceTools:
         print("=" * 40)
 
     def backup_database(self, filename=None):
-        """Sauvegarde la base de données"""
+        """Sauvegarde la base de données (dans le répertoire des sauvegardes)"""
         if not filename:
             filename = f"backup_tourisme_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
 
-        try:
-            import shutil
-
-            shutil.copy("tourisme_data.db", filename)
-            print(f"Sauvegarde créée: {filename}")
-        except Exception as e:
-            print(f" Erreur lors de la sauvegarde: {e}")
+        backup_path = self.backups.create_backup(filename)
+        if backup_path:
+            print(f"Sauvegarde créée: {backup_path}")
 
     def restore_database(self, backup_filename):
         """Restaure la base de données depuis une sauvegarde"""
@@ -105,13 +100,9 @@ class MaintenanceTools:
             f" Êtes-vous sûr de vouloir restaurer depuis {backup_filename} ? (oui/non): "
         )
         if confirm.lower() == "oui":
-            try:
-                import shutil
-
-                shutil.copy(backup_filename, "tourisme_data.db")
+            if self.backups.restore_backup(backup_filename):
+                self.db.recharger()
                 print("Base de données restaurée")
-            except Exception as e:
-                print(f" Erreur lors de la restauration: {e}")
         else:
             print(" Restauration annulée")
 
@@ -0,0 +1,45 @@
+"""
+Limitation de débit par client (seaux à jetons) pour l'API
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """
+    Seau à jetons par clé client, thread-safe et borné.
+
+    Chaque clé dispose de `rafale` jetons, regarnis à raison de `debit`
+    jetons par seconde ; une requête consomme un jeton. Au-delà de `max_cles`
+    clients suivis, les moins récemment vus sont oubliés (leur seau repart
+    plein, ce qui ne fait qu'assouplir la limite).
+    """
+
+    def __init__(self, debit, rafale, max_cles=10000):
+        self.debit = debit
+        self.rafale = rafale
+        self.max_cles = max_cles
+        self._seaux = OrderedDict()  # clé -> (jetons, date de mise à jour)
+        self._lock = threading.Lock()
+        self.stats = {"autorisees": 0, "refusees": 0}
+
+    def autoriser(self, cle):
+        """Retourne (autorisée, secondes avant le prochain jeton)"""
+        maintenant = time.monotonic()
+        with self._lock:
+            jetons, date = self._seaux.pop(cle, (self.rafale, maintenant))
+            jetons = min(self.rafale, jetons + (maintenant - date) * self.debit)
+            autorisee = jetons >= 1
+            if autorisee:
+                jetons -= 1
+            self._seaux[cle] = (jetons, maintenant)
+            while len(self._seaux) > self.max_cles:
+                self._seaux.popitem(last=False)
+            self.stats["autorisees" if autorisee else "refusees"] += 1
+        return autorisee, 0.0 if autorisee else (1 - jetons) / self.debit
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "clients": len(self._seaux)}
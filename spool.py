@@ -0,0 +1,615 @@
+"""
+Spool d'ingestion pour plusieurs nœuds : segments NDJSON en ajout seul et compacteur
+
+Chaque processus de l'API ajoute les événements validés à un segment local
+(`<nœud>-<pid>-<instance>-<horodatage>-<numéro>.ndjson.part`, où `instance`
+est tiré au hasard à chaque démarrage). Le segment est synchronisé
+sur disque par lots puis scellé (renommé en `.ndjson`) quand il atteint sa
+taille ou son âge maximal. Un processus compacteur séparé applique les
+segments scellés à la base SQLite en grandes transactions :
+
+    python spool.py
+
+Le nom de chaque segment appliqué est enregistré dans la même transaction que
+ses événements (table segments_appliques) : après un arrêt brutal, un segment
+n'est jamais appliqué deux fois et n'est supprimé qu'une fois appliqué.
+"""
+
+import json
+import logging
+import os
+import secrets
+import socket
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows : repli sur le PID pour détecter les orphelins
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EXTENSION_SCELLE = ".ndjson"
+EXTENSION_OUVERT = ".ndjson.part"
+
+
+def _maintenant():
+    """Date de réception (UTC, format stocké) : le compactage peut être différé"""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+
+def _synchroniser_dossier(dossier):
+    """Rend durable un renommage dans `dossier` (sans effet sous Windows)"""
+    try:
+        fd = os.open(dossier, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _processus_actif(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _verrouiller(fichier):
+    """
+    Pose un verrou exclusif non bloquant sur un segment ouvert
+
+    Le verrou est tenu tant que le processus écrivain vit : il est libéré par
+    le système à sa mort, même si un autre processus reprend son PID.
+    Retourne False si un autre processus tient le verrou (True sans fcntl).
+    """
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fichier.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _sceller(chemin):
+    """
+    Scelle un segment ouvert laissé par un processus arrêté
+
+    Une dernière ligne incomplète (écriture interrompue) est tronquée.
+    Retourne False sans rien modifier si le segment est encore verrouillé
+    par son processus écrivain.
+    """
+    with open(chemin, "rb+") as fichier:
+        if not _verrouiller(fichier):
+            return False
+        contenu = fichier.read()
+        fin = contenu.rfind(b"\n") + 1
+        if fin < len(contenu):
+            fichier.truncate(fin)
+        fichier.flush()
+        os.fsync(fichier.fileno())
+    if fin == 0:
+        os.remove(chemin)
+    else:
+        os.replace(chemin, chemin[: -len(EXTENSION_OUVERT)] + EXTENSION_SCELLE)
+    return True
+
+
+class SpoolWriter:
+    """
+    Ajoute les événements de tracking à des segments NDJSON locaux.
+
+    Même interface que ingestion.IngestionQueue (submit_visiteur,
+    submit_vue_page, submit_vue_totale, start, stop, flush, get_stats), plus
+    submit_batch et submit_lot_idempotent pour /tracking/bulk. Un événement
+    est une ligne JSON `[type, données]` ; un lot bulk tient sur une seule
+    ligne pour rester atomique (`lot_id` s'il porte des clés de
+    déduplication), et les événements sans date reçoivent leur date de réception.
+    Un thread d'arrière-plan synchronise le segment sur disque
+    toutes les `flush_interval_ms` millisecondes et le scelle après
+    `segment_max_bytes` octets ou `segment_max_s` secondes.
+
+    submit() est appelé depuis la boucle d'événements : il ne fait qu'ajouter
+    la ligne au tampon du segment sous `_lock`. Les fsync, fermetures et
+    renommages se font hors de ce verrou, dans le thread d'arrière-plan (ou
+    flush/stop), sous `_lock_disque`.
+    """
+
+    def __init__(
+        self,
+        dossier,
+        noeud=None,
+        flush_interval_ms=200,
+        segment_max_bytes=16 * 1024 * 1024,
+        segment_max_s=60,
+    ):
+        self.dossier = dossier
+        self.noeud = (noeud or socket.gethostname()).replace("-", "_")
+        # Jeton propre à cette instance : un processus redémarré avec le PID
+        # d'un processus arrêté ne prend pas ses segments pour les siens
+        self.instance = secrets.token_hex(4)
+        self.flush_interval = flush_interval_ms / 1000
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_s = segment_max_s
+        self._lock = threading.Lock()
+        self._lock_disque = threading.Lock()
+        self._fichier = None
+        self._chemin = None
+        self._taille = 0
+        self._ouverture = 0.0
+        self._numero = 0
+        self._a_synchroniser = False
+        # Segments pleins détachés par submit(), à sceller hors de la boucle
+        self._a_sceller = []
+        self._thread = None
+        self._stopping = threading.Event()
+        self.stats = {
+            "evenements_recus": 0,
+            "evenements_refuses": 0,
+            "segments_scelles": 0,
+            "synchronisations": 0,
+            "erreurs": 0,
+        }
+        os.makedirs(dossier, exist_ok=True)
+
+    def start(self):
+        """Scelle les segments orphelins du nœud et démarre la synchronisation"""
+        self._sceller_orphelins()
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="spool-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Arrête le thread de synchronisation et scelle le segment courant"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            self._detacher()
+        self._sceller_detaches()
+
+    def submit(self, event):
+        """
+        Ajoute un événement au segment courant.
+
+        Retourne False si l'écriture échoue (disque plein, droits...) :
+        l'appelant doit alors écrire l'événement directement.
+        """
+        ligne = (
+            json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+        ).encode("utf-8")
+        with self._lock:
+            try:
+                if self._fichier is None:
+                    self._ouvrir()
+                self._fichier.write(ligne)
+                self._taille += len(ligne)
+                self._a_synchroniser = True
+                if self._taille >= self.segment_max_bytes:
+                    self._detacher()
+            except OSError as e:
+                self.stats["evenements_refuses"] += 1
+                logger.error(
+                    "Erreur lors de l'écriture dans le spool %s: %s", self._chemin, e
+                )
+                return False
+            self.stats["evenements_recus"] += 1
+        return True
+
+    def submit_visiteur(
+        self, type_visiteur, temps_sejour, tranche_age, type_personna, date_visite=None
+    ):
+        return self.submit(
+            [
+                "visiteur",
+                [
+                    type_visiteur,
+                    temps_sejour,
+                    tranche_age,
+                    type_personna,
+                    date_visite or _maintenant(),
+                ],
+            ]
+        )
+
+    def submit_vue_page(self, nom_page, categorie, nombre=1, date_vue=None):
+        return self.submit(
+            ["page", [nom_page, categorie, nombre, date_vue or _maintenant()]]
+        )
+
+    def submit_vue_totale(self):
+        return self.submit(["vue_totale", 1])
+
+    def submit_batch(self, visiteurs=(), vues_pages=(), vues_totales=0):
+        maintenant = _maintenant()
+        visiteurs = [list(v[:4]) + [v[4] or maintenant] for v in visiteurs]
+        vues_pages = [list(p[:3]) + [p[3] or maintenant] for p in vues_pages]
+        return self.submit(["lot", [visiteurs, vues_pages, vues_totales]])
+
+    def submit_lot_idempotent(self, cle_lot, visiteurs=(), vues_pages=(), vues_totales=0):
+        """
+        Ajoute un lot portant des clés de déduplication (voir dedup.DedupIndex)
+
+        `visiteurs` et `vues_pages` sont des listes de (clé ou None, événement) ;
+        le compacteur écarte les clés déjà ingérées dans sa transaction.
+        """
+        maintenant = _maintenant()
+        visiteurs = [[c, list(v[:4]) + [v[4] or maintenant]] for c, v in visiteurs]
+        vues_pages = [[c, list(p[:3]) + [p[3] or maintenant]] for c, p in vues_pages]
+        return self.submit(["lot_id", [cle_lot, visiteurs, vues_pages, vues_totales]])
+
+    def flush(self):
+        """Synchronise le segment courant sur disque et scelle les segments pleins"""
+        self._sceller_detaches()
+        self._synchroniser()
+
+    def get_stats(self):
+        """Retourne les compteurs du spool"""
+        with self._lock:
+            segment = os.path.basename(self._chemin) if self._fichier else None
+            taille = self._taille if self._fichier else 0
+            return {
+                **self.stats,
+                "segment_courant": segment,
+                "octets_en_cours": taille,
+                "segments_a_sceller": len(self._a_sceller),
+            }
+
+    def _ouvrir(self):
+        self._numero += 1
+        nom = (
+            f"{self.noeud}-{os.getpid()}-{self.instance}-{int(time.time() * 1000)}-"
+            f"{self._numero:06d}{EXTENSION_OUVERT}"
+        )
+        self._chemin = os.path.join(self.dossier, nom)
+        # Créé sous un nom temporaire puis verrouillé avant de recevoir son nom
+        # de segment : _sceller_orphelins ne voit jamais un segment non verrouillé
+        # d'un processus vivant
+        provisoire = self._chemin + ".new"
+        fichier = open(provisoire, "ab")
+        _verrouiller(fichier)
+        os.replace(provisoire, self._chemin)
+        self._fichier = fichier
+        self._taille = 0
+        self._ouverture = time.monotonic()
+
+    def _detacher(self):
+        """Retire le segment courant pour qu'il soit scellé hors du verrou (verrou détenu)"""
+        if self._fichier is None:
+            return
+        self._a_sceller.append((self._fichier, self._chemin, self._taille))
+        self._fichier = None
+        self._a_synchroniser = False
+
+    def _synchroniser(self):
+        """Vide le tampon sous le verrou puis fait le fsync hors du verrou"""
+        with self._lock_disque:
+            with self._lock:
+                if self._fichier is None or not self._a_synchroniser:
+                    return
+                fichier = self._fichier
+                fichier.flush()
+                self._a_synchroniser = False
+            # Le segment ne peut pas être fermé entre-temps : seul le détenteur
+            # de _lock_disque ferme les segments détachés
+            os.fsync(fichier.fileno())
+            with self._lock:
+                self.stats["synchronisations"] += 1
+
+    def _sceller_detaches(self):
+        """Synchronise, ferme et scelle les segments détachés"""
+        with self._lock_disque:
+            with self._lock:
+                segments, self._a_sceller = self._a_sceller, []
+            for fichier, chemin, taille in segments:
+                try:
+                    fichier.flush()
+                    os.fsync(fichier.fileno())
+                    if fcntl is None:
+                        # Windows : un fichier ouvert ne peut pas être renommé
+                        fichier.close()
+                    # Sinon le segment reste verrouillé jusqu'au renommage : un
+                    # autre processus ne peut pas le sceller en même temps
+                    if taille:
+                        scelle = chemin[: -len(EXTENSION_OUVERT)] + EXTENSION_SCELLE
+                        os.replace(chemin, scelle)
+                    else:
+                        os.remove(chemin)
+                    fichier.close()
+                except OSError as e:
+                    # Le segment reste ouvert (.part) : il sera scellé comme
+                    # orphelin au prochain démarrage du nœud
+                    with self._lock:
+                        self.stats["erreurs"] += 1
+                    logger.error(
+                        "Erreur lors du scellement du segment %s: %s", chemin, e
+                    )
+                    continue
+                with self._lock:
+                    self.stats["synchronisations"] += 1
+                    if taille:
+                        self.stats["segments_scelles"] += 1
+            if segments:
+                _synchroniser_dossier(self.dossier)
+
+    def _sceller_orphelins(self):
+        """
+        Scelle les segments ouverts de ce nœud laissés par un processus arrêté
+
+        Tout segment qui n'appartient pas à cette instance est candidat ; il
+        n'est scellé que si son verrou est libre (processus écrivain arrêté),
+        quel que soit le PID inscrit dans son nom, qui peut avoir été repris.
+        Sans fcntl, le PID sert de repli : un segment portant notre PID mais
+        un autre jeton vient forcément d'un processus arrêté.
+        """
+        prefixe = f"{self.noeud}-"
+        for nom in os.listdir(self.dossier):
+            if not (nom.startswith(prefixe) and nom.endswith(EXTENSION_OUVERT)):
+                continue
+            try:
+                pid, instance = nom[len(prefixe) :].split("-", 2)[:2]
+                pid = int(pid)
+            except ValueError:
+                continue
+            if instance == self.instance:
+                continue
+            if fcntl is None and pid != os.getpid() and _processus_actif(pid):
+                continue
+            try:
+                _sceller(os.path.join(self.dossier, nom))
+            except FileNotFoundError:
+                pass  # scellé au même moment par un autre processus du nœud
+        _synchroniser_dossier(self.dossier)
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                with self._lock:
+                    if (
+                        self._fichier is not None
+                        and time.monotonic() - self._ouverture >= self.segment_max_s
+                    ):
+                        self._detacher()
+                self._sceller_detaches()
+                self._synchroniser()
+            except OSError as e:
+                with self._lock:
+                    self.stats["erreurs"] += 1
+                logger.error("Erreur lors de la synchronisation du spool: %s", e)
+
+
+def _liste(valeur, longueur=None):
+    if not isinstance(valeur, list):
+        raise ValueError(f"liste attendue: {valeur!r}")
+    if longueur is not None and len(valeur) != longueur:
+        raise ValueError(f"{longueur} éléments attendus: {valeur!r}")
+    return valeur
+
+
+def _texte(valeur):
+    if not isinstance(valeur, str):
+        raise ValueError(f"texte attendu: {valeur!r}")
+    return valeur
+
+
+def _cle(valeur):
+    if valeur is not None and not isinstance(valeur, str):
+        raise ValueError(f"clé attendue: {valeur!r}")
+    return valeur
+
+
+def _entier(valeur):
+    if isinstance(valeur, bool) or not isinstance(valeur, int) or valeur < 0:
+        raise ValueError(f"entier positif attendu: {valeur!r}")
+    return valeur
+
+
+def _lire_ligne(ligne):
+    """(type, données) d'une ligne de segment ; ValueError si elle est mal formée"""
+    kind, payload = _liste(json.loads(ligne), 2)
+    if kind not in ("visiteur", "page", "vue_totale", "lot", "lot_id"):
+        raise ValueError(f"type inconnu: {kind!r}")
+    return kind, payload
+
+
+def _visiteur(valeurs):
+    """Tuple (type_visiteur, temps_sejour, tranche_age, type_personna, date_visite)"""
+    return tuple(_texte(v) for v in _liste(valeurs, 5))
+
+
+def _vue_page(valeurs):
+    """Tuple (nom_page, categorie, nombre, date_vue)"""
+    nom_page, categorie, nombre, date_vue = _liste(valeurs, 4)
+    return (_texte(nom_page), _texte(categorie), _entier(nombre), _texte(date_vue))
+
+
+def _lot_idempotent(valeurs):
+    """Tuple (clé du lot, [(clé, visiteur)], [(clé, vue_page)], vues_totales)"""
+    cle_lot, visiteurs, vues_pages, vues_totales = _liste(valeurs, 4)
+    cle_lot = _cle(cle_lot)
+    visiteurs = [
+        (_cle(c), _visiteur(v)) for c, v in (_liste(e, 2) for e in _liste(visiteurs))
+    ]
+    vues_pages = [
+        (_cle(c), _vue_page(p)) for c, p in (_liste(e, 2) for e in _liste(vues_pages))
+    ]
+    vues_totales = _entier(vues_totales)
+    if vues_totales and cle_lot is None:
+        raise ValueError("vues_totales sans clé de lot")
+    return cle_lot, visiteurs, vues_pages, vues_totales
+
+
+def _taille(visiteurs, vues_pages, idempotents):
+    """Nombre d'événements à appliquer, lots idempotents compris"""
+    return (
+        len(visiteurs)
+        + len(vues_pages)
+        + sum(len(v) + len(p) for _, v, p, _ in idempotents)
+    )
+
+
+class Compacteur:
+    """
+    Applique les segments scellés du spool à la base SQLite.
+
+    Les segments sont lus dans l'ordre de leur nom et regroupés jusqu'à
+    `max_evenements` événements par transaction. Un segment déjà enregistré
+    dans segments_appliques est seulement supprimé. Chaque ligne est validée
+    (type, nombre et types des champs) avant d'être retenue : une ligne
+    illisible ou mal formée est ignorée et comptée dans "lignes_invalides",
+    sans bloquer le reste du spool. Les lots `lot_id` sont dédupliqués
+    contre identifiants_ingestion dans la transaction qui les applique.
+    """
+
+    def __init__(self, db, dossier, max_evenements=100000):
+        self.db = db
+        self.dossier = dossier
+        self.max_evenements = max_evenements
+        self.stats = {
+            "segments_appliques": 0,
+            "segments_deja_appliques": 0,
+            "evenements_appliques": 0,
+            "lignes_invalides": 0,
+            "doublons_ecartes": 0,
+            "transactions": 0,
+        }
+
+    def segments_scelles(self):
+        """Chemins des segments scellés, dans l'ordre d'écriture par processus"""
+        if not os.path.isdir(self.dossier):
+            return []
+        return [
+            os.path.join(self.dossier, nom)
+            for nom in sorted(os.listdir(self.dossier))
+            if nom.endswith(EXTENSION_SCELLE)
+        ]
+
+    def compacter(self):
+        """Applique tous les segments scellés et retourne le nombre d'événements"""
+        chemins = self.segments_scelles()
+        deja_appliques = self.db.get_segments_appliques(
+            os.path.basename(chemin) for chemin in chemins
+        )
+        total = 0
+        lot = []
+        visiteurs, vues_pages, vues_totales, idempotents = [], [], 0, []
+        for chemin in chemins:
+            if os.path.basename(chemin) in deja_appliques:
+                os.remove(chemin)
+                self.stats["segments_deja_appliques"] += 1
+                continue
+            nombre, v, p, n, i = self._lire(chemin)
+            lot.append((chemin, nombre))
+            visiteurs += v
+            vues_pages += p
+            vues_totales += n
+            idempotents += i
+            if _taille(visiteurs, vues_pages, idempotents) >= self.max_evenements:
+                total += self._appliquer(
+                    lot, visiteurs, vues_pages, vues_totales, idempotents
+                )
+                lot = []
+                visiteurs, vues_pages, vues_totales, idempotents = [], [], 0, []
+        if lot:
+            total += self._appliquer(lot, visiteurs, vues_pages, vues_totales, idempotents)
+        return total
+
+    def executer(self, intervalle=5, arret=None):
+        """Compacte en boucle toutes les `intervalle` secondes jusqu'à `arret`"""
+        arret = arret or threading.Event()
+        while not arret.is_set():
+            try:
+                nombre = self.compacter()
+                if nombre:
+                    logger.info("%d événements appliqués depuis le spool", nombre)
+            except Exception as e:
+                logger.error("Erreur lors du compactage du spool: %s", e)
+            arret.wait(intervalle)
+
+    def _lire(self, chemin):
+        nombre = 0
+        visiteurs, vues_pages, vues_totales, idempotents = [], [], 0, []
+        with open(chemin, "rb") as fichier:
+            for ligne in fichier:
+                try:
+                    kind, payload = _lire_ligne(ligne)
+                    if kind == "visiteur":
+                        visiteurs.append(_visiteur(payload))
+                    elif kind == "page":
+                        vues_pages.append(_vue_page(payload))
+                    elif kind == "vue_totale":
+                        vues_totales += _entier(payload)
+                    elif kind == "lot_id":
+                        idempotents.append(_lot_idempotent(payload))
+                    else:
+                        # Lot : validé entièrement avant d'en garder un élément
+                        v, p, n = _liste(payload, 3)
+                        v = [_visiteur(visiteur) for visiteur in _liste(v)]
+                        p = [_vue_page(page) for page in _liste(p)]
+                        n = _entier(n)
+                        visiteurs += v
+                        vues_pages += p
+                        vues_totales += n
+                except (ValueError, TypeError) as e:
+                    self.stats["lignes_invalides"] += 1
+                    logger.warning(
+                        "Ligne ignorée dans %s: %s", os.path.basename(chemin), e
+                    )
+                    continue
+                nombre += 1
+        return nombre, visiteurs, vues_pages, vues_totales, idempotents
+
+    def _appliquer(self, lot, visiteurs, vues_pages, vues_totales, idempotents=()):
+        ecartes = self.db.appliquer_segments(
+            [(os.path.basename(chemin), nombre) for chemin, nombre in lot],
+            visiteurs,
+            vues_pages,
+            vues_totales,
+            idempotents,
+        )
+        # Les segments ne sont supprimés qu'une fois la transaction validée
+        for chemin, _ in lot:
+            os.remove(chemin)
+        appliques = _taille(visiteurs, vues_pages, idempotents) - ecartes
+        self.stats["transactions"] += 1
+        self.stats["segments_appliques"] += len(lot)
+        self.stats["evenements_appliques"] += appliques
+        self.stats["doublons_ecartes"] += ecartes
+        return appliques
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from database import DatabaseManager
+
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    db = DatabaseManager()
+    compacteur = Compacteur(
+        db,
+        os.getenv("SPOOL_DIR", "spool"),
+        max_evenements=int(os.getenv("SPOOL_COMPACT_MAX_EVENTS", "100000")),
+    )
+    logger.info("Compactage du spool %s (Ctrl+C pour arrêter)", compacteur.dossier)
+    try:
+        compacteur.executer(float(os.getenv("SPOOL_COMPACT_INTERVAL_S", "5")))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
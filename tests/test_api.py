@@ -0,0 +1,106 @@
+"""
+Tests de l'API REST (ignorés si FastAPI ou httpx n'est pas installé)
+"""
+
+import importlib
+import sys
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")  # requis par TestClient
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    """Client de test sur une base vide créée dans un répertoire temporaire"""
+    repertoire = tmp_path_factory.mktemp("api")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(repertoire)
+        mp.setenv("INGESTION_MODE", "direct")
+        sys.modules.pop("api", None)
+        api = importlib.import_module("api")
+        with TestClient(api.app) as client:
+            yield client
+        sys.modules.pop("api", None)
+
+
+def test_series_temporelles_bornes_avec_fuseau(client):
+    reponse = client.get(
+        "/timeseries",
+        params={
+            "granularite": "jour",
+            "from": "2024-01-01T00:00:00Z",
+            "to": "2024-01-03T12:00:00+02:00",
+        },
+    )
+    assert reponse.status_code == 200
+    donnees = reponse.json()
+    assert donnees["periodes"] == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    assert donnees["visiteurs"] == {"total": [0, 0, 0]}
+
+
+def test_series_temporelles_bornes_inversees(client):
+    reponse = client.get(
+        "/timeseries",
+        params={"from": "2024-01-03T00:00:00Z", "to": "2024-01-01"},
+    )
+    assert reponse.status_code == 400
+
+
+VISITEUR = {
+    "type_visiteur": "Touriste",
+    "temps_sejour": "1 jour",
+    "tranche_age": "18-25",
+    "type_personna": "Famille",
+}
+
+
+@pytest.fixture(scope="module")
+def visiteur_enregistre(client):
+    reponse = client.post(
+        "/visiteur", json={**VISITEUR, "date_visite": "2023-06-01T10:00:00Z"}
+    )
+    assert reponse.status_code == 200
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"date_debut": "2023-06-01T10:00:00", "date_fin": "2023-06-01"},
+        {"date_debut": "2023-06-01T09:00:00Z", "date_fin": "2023-06-01T13:00:00+02:00"},
+    ],
+)
+def test_visiteurs_bornes_iso_et_fuseau(client, visiteur_enregistre, params):
+    reponse = client.get("/visiteurs", params=params)
+    assert reponse.status_code == 200
+    assert [v["date_visite"] for v in reponse.json()] == ["2023-06-01 10:00:00"]
+
+
+def test_visiteurs_borne_invalide(client):
+    reponse = client.get("/visiteurs", params={"date_debut": "garbage"})
+    assert reponse.status_code == 422
+
+
+@pytest.mark.parametrize("chemin", ["/export/visiteurs", "/export/pages"])
+def test_export_borne_invalide(client, chemin):
+    reponse = client.get(chemin, params={"date_fin": "2023-13-45"})
+    assert reponse.status_code == 422
+
+
+def test_export_visiteurs_borne_avec_fuseau(client, visiteur_enregistre):
+    reponse = client.get(
+        "/export/visiteurs",
+        params={"format": "ndjson", "date_debut": "2023-06-01T09:59:00Z"},
+    )
+    assert reponse.status_code == 200
+    assert len(reponse.text.splitlines()) == 1
+
+
+def test_tableau_croise_borne_invalide(client):
+    reponse = client.get(
+        "/stats/crosstab",
+        params={"rows": "type_visiteur", "cols": "tranche_age", "from": "garbage"},
+    )
+    assert reponse.status_code == 422
@@ -0,0 +1,62 @@
+"""
+Tests du cache des lectures indexé par la version des tables
+"""
+
+import pytest
+
+from cache import ResultCache
+from database import DatabaseManager
+
+VISITEUR = ("Touriste", "1 jour", "18-25", "Famille")
+DIMENSIONS = ("type_visiteur", "tranche_age")
+
+
+@pytest.fixture
+def bases(tmp_path):
+    chemin = str(tmp_path / "test.db")
+    api = DatabaseManager(
+        chemin, cache=ResultCache(), ecrivain_unique=False, intervalle_versions=3600
+    )
+    autre = DatabaseManager(chemin, ecrivain_unique=False)
+    yield api, autre
+    autre.close()
+    api.close()
+
+
+def test_succes_sans_requete(bases, monkeypatch):
+    api, _ = bases
+    api.add_visiteur(*VISITEUR)
+    attendu = api.get_cube_visiteurs(DIMENSIONS)
+
+    def interdit():
+        raise AssertionError("requête SQLite sur un succès du cache")
+
+    monkeypatch.setattr(api, "get_connection", interdit)
+    assert api.get_cube_visiteurs(DIMENSIONS) == attendu
+    assert api.get_version_donnees()[0] > 0
+
+
+def test_ecriture_sur_une_autre_table_conserve_les_entrees(bases):
+    api, _ = bases
+    api.add_visiteur(*VISITEUR)
+    api.get_cube_visiteurs(DIMENSIONS)
+    api.add_vue_page("accueil", "general")
+    succes = api.cache.get_stats()["hits"]
+    api.get_cube_visiteurs(DIMENSIONS)
+    assert api.cache.get_stats()["hits"] == succes + 1
+
+
+def test_ecriture_d_un_autre_processus_visible_apres_relecture(bases):
+    api, autre = bases
+    api.add_visiteur(*VISITEUR)
+    assert api.get_cube_visiteurs(DIMENSIONS) == [("Touriste", "18-25", 1)]
+    version = api.get_version_donnees()[0]
+
+    autre.add_visiteur("Local", "2 jours", "26-35", "Solo")
+    # Avant la relecture des versions : résultat et version restent cohérents
+    assert api.get_cube_visiteurs(DIMENSIONS) == [("Touriste", "18-25", 1)]
+    assert api.get_version_donnees()[0] == version
+
+    api._instantane_versions = None  # intervalle de relecture écoulé
+    assert api.get_version_donnees()[0] > version
+    assert len(api.get_cube_visiteurs(DIMENSIONS)) == 2
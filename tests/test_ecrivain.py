@@ -0,0 +1,62 @@
+"""
+Tests de l'écrivain unique : échéance des écritures et API asynchrone
+"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from database import BaseVerrouilleeError, DatabaseManager
+
+VISITEUR = ("Touriste", "1 jour", "18-25", "Famille")
+
+
+@pytest.fixture
+def chemin(tmp_path):
+    return str(tmp_path / "test.db")
+
+
+def test_attente_en_file_bornee_par_le_delai(chemin):
+    db = DatabaseManager(chemin, delai_verrou=0.5)
+    bloqueur = sqlite3.connect(chemin, isolation_level=None)
+    bloqueur.execute("BEGIN IMMEDIATE")
+    durees, erreurs = [], []
+
+    def ecrire():
+        debut = time.monotonic()
+        try:
+            db.add_visiteur(*VISITEUR)
+        except BaseVerrouilleeError as e:
+            erreurs.append(e)
+        durees.append(time.monotonic() - debut)
+
+    ecrivains = [threading.Thread(target=ecrire) for _ in range(5)]
+    try:
+        for ecrivain in ecrivains:
+            ecrivain.start()
+        for ecrivain in ecrivains:
+            ecrivain.join()
+    finally:
+        bloqueur.execute("ROLLBACK")
+        bloqueur.close()
+        db.close()
+    assert len(erreurs) == 5
+    assert max(durees) < 0.9
+
+
+def test_soumettre_ecriture_retourne_un_future(chemin):
+    db = DatabaseManager(chemin)
+    try:
+        future = db.soumettre_ecriture(
+            lambda cursor: cursor.execute("SELECT 1").fetchone()[0]
+        )
+        assert future.result(timeout=5) == 1
+        echec = db.soumettre_ecriture(
+            lambda cursor: cursor.execute("INSERT INTO table_absente VALUES (1)")
+        )
+        with pytest.raises(sqlite3.OperationalError):
+            echec.result(timeout=5)
+    finally:
+        db.close()
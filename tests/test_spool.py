@@ -0,0 +1,101 @@
+"""
+Tests du spool d'ingestion (segments, segments orphelins) et du compacteur
+"""
+
+import json
+import os
+
+import pytest
+
+from database import DatabaseManager
+from spool import EXTENSION_OUVERT, EXTENSION_SCELLE, Compacteur, SpoolWriter
+
+VISITEUR = ("Touriste", "1 jour", "18-25", "Famille", "2024-01-01 10:00:00")
+PAGE = ("accueil", "general", 2, "2024-01-01 10:00:00")
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / "test.db"), ecrivain_unique=False)
+    yield db
+    db.close()
+
+
+def _segments(dossier, extension):
+    return sorted(nom for nom in os.listdir(dossier) if nom.endswith(extension))
+
+
+def test_redemarrage_apres_arret_brutal_avec_pid_reutilise(tmp_path, db):
+    dossier = str(tmp_path / "spool")
+    ancien = SpoolWriter(dossier, noeud="noeud")
+    assert ancien.submit_visiteur(*VISITEUR)
+    assert ancien.submit_vue_page(*PAGE)
+    ancien.flush()
+    # Arrêt brutal : le segment n'est pas scellé, le verrou est libéré par le
+    # système. Le nouveau processus reprend le même PID (ici, le même processus).
+    ancien._fichier.close()
+    assert len(_segments(dossier, EXTENSION_OUVERT)) == 1
+
+    nouveau = SpoolWriter(dossier, noeud="noeud")
+    nouveau.start()
+    try:
+        assert _segments(dossier, EXTENSION_OUVERT) == []
+        assert len(_segments(dossier, EXTENSION_SCELLE)) == 1
+        assert Compacteur(db, dossier).compacter() == 2
+    finally:
+        nouveau.stop()
+    assert db.get_resume_statistiques()["nombre_visiteurs"] == 1
+
+
+def test_segment_d_un_processus_vivant_non_scelle(tmp_path, db):
+    dossier = str(tmp_path / "spool")
+    actif = SpoolWriter(dossier, noeud="noeud")
+    assert actif.submit_visiteur(*VISITEUR)
+    actif.flush()
+
+    autre = SpoolWriter(dossier, noeud="noeud")
+    autre.start()
+    autre.stop()
+    assert len(_segments(dossier, EXTENSION_OUVERT)) == 1
+    assert _segments(dossier, EXTENSION_SCELLE) == []
+
+    actif.stop()
+    assert len(_segments(dossier, EXTENSION_SCELLE)) == 1
+    assert Compacteur(db, dossier).compacter() == 1
+
+
+def test_lignes_invalides_ignorees(tmp_path, db):
+    dossier = tmp_path / "spool"
+    dossier.mkdir()
+    lignes = [
+        ["visiteur", list(VISITEUR)],
+        ["visiteur", ["x", "y"]],
+        ["page", ["accueil", "general", True, "2024-01-01 10:00:00"]],
+        ["lot", [[list(VISITEUR)], [], "3"]],
+        [1, 2, 3],
+        ["page", list(PAGE)],
+    ]
+    contenu = "\n".join(json.dumps(ligne) for ligne in lignes) + "\n{tronquée\n"
+    (dossier / f"noeud-1-a-1-000001{EXTENSION_SCELLE}").write_text(contenu)
+
+    compacteur = Compacteur(db, str(dossier))
+    assert compacteur.compacter() == 2
+    assert compacteur.stats["lignes_invalides"] == 5
+    assert os.listdir(dossier) == []
+
+
+def test_lot_idempotent_rejoue_ecarte_au_compactage(tmp_path, db):
+    dossier = str(tmp_path / "spool")
+    spool = SpoolWriter(dossier, noeud="noeud")
+    for _ in range(2):
+        assert spool.submit_lot_idempotent(
+            "lot:1", [("visiteur:1", VISITEUR)], [("page:1", PAGE)], 5
+        )
+    spool.stop()
+
+    compacteur = Compacteur(db, dossier)
+    assert compacteur.compacter() == 2
+    assert compacteur.stats["doublons_ecartes"] == 2
+    resume = db.get_resume_statistiques()
+    assert resume["nombre_visiteurs"] == 1
+    assert resume["vues_totales"] == 5
@@ -0,0 +1,174 @@
+"""
+Écrivain unique : toutes les écritures SQLite passent par un seul thread
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SingleWriter:
+    """
+    Thread propriétaire de la seule connexion d'écriture.
+
+    N'importe quel thread soumet des opérations (fonctions recevant un curseur)
+    et reçoit un Future. Le thread d'écriture regroupe les opérations en
+    attente, jusqu'à `taille_lot`, dans une seule transaction ; chacune
+    s'exécute dans un SAVEPOINT, si bien qu'une opération en échec n'annule
+    que ses propres modifications.
+
+    `connect` crée la connexion d'écriture (en mode autocommit) et
+    `reessayer(fonction, echeance)` rejoue une transaction tant que la base
+    est verrouillée par un autre processus, au plus jusqu'à `echeance`
+    (instant time.monotonic(), None pour le délai par défaut).
+
+    Une opération peut porter une échéance : un lot n'est pas réessayé au-delà
+    de la plus proche. S'il échoue alors, les opérations dont l'échéance n'est
+    pas atteinte sont remises en file au lieu d'échouer avec lui.
+    """
+
+    def __init__(self, connect, reessayer, taille_lot=256):
+        self._connect = connect
+        self._reessayer = reessayer
+        self.taille_lot = taille_lot
+        self._queue = queue.Queue()
+        self._thread = None
+        self._cursor = None
+        self._stopping = threading.Event()
+        self.stats = {"operations": 0, "transactions": 0, "operations_en_erreur": 0}
+        # Durée moyenne (mobile exponentielle) d'une transaction, réessais compris
+        self.latence_ms = 0.0
+
+    def start(self):
+        """Démarre le thread d'écriture"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sqlite-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Écrit les opérations en attente puis arrête le thread"""
+        self._stopping.set()
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def soumettre(self, operation, echeance=None):
+        """Met une opération en file et retourne son Future"""
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # Opération imbriquée : déjà dans la transaction en cours
+            try:
+                future.set_result(operation(self._cursor))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        if self._stopping.is_set() or self._thread is None:
+            raise RuntimeError("L'écrivain SQLite est arrêté")
+        self._queue.put((operation, future, echeance))
+        return future
+
+    def executer(self, operation):
+        """Exécute une opération et attend son résultat"""
+        return self.soumettre(operation).result()
+
+    def get_stats(self):
+        """Retourne les compteurs de l'écrivain"""
+        transactions = self.stats["transactions"]
+        return {
+            **self.stats,
+            "operations_par_transaction": (
+                self.stats["operations"] / transactions if transactions else 0.0
+            ),
+            "en_attente": self._queue.qsize(),
+            "latence_ms": round(self.latence_ms, 2),
+        }
+
+    def _run(self):
+        conn = self._connect()
+        self._cursor = conn.cursor()
+        try:
+            arret = False
+            while not arret:
+                element = self._queue.get()
+                if element is None:
+                    break
+                lot = [element]
+                while len(lot) < self.taille_lot:
+                    try:
+                        element = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if element is None:
+                        arret = True
+                        break
+                    lot.append(element)
+                # Une opération remise en file est déjà marquée en cours
+                lot = [
+                    element
+                    for element in lot
+                    if element[1].running() or element[1].set_running_or_notify_cancel()
+                ]
+                if lot:
+                    self._executer_lot(lot)
+        finally:
+            self._cursor = None
+            conn.close()
+
+    def _executer_lot(self, lot):
+        debut = time.monotonic()
+        echeances = [echeance for _, _, echeance in lot if echeance is not None]
+        try:
+            resultats = self._reessayer(
+                lambda: self._transaction(lot), min(echeances, default=None)
+            )
+        except Exception as e:
+            maintenant = time.monotonic()
+            for element in lot:
+                echeance = element[2]
+                if (
+                    echeance is not None
+                    and echeance > maintenant
+                    and not self._stopping.is_set()
+                ):
+                    self._queue.put(element)
+                else:
+                    element[1].set_exception(e)
+            return
+        finally:
+            duree_ms = (time.monotonic() - debut) * 1000
+            self.latence_ms += 0.2 * (duree_ms - self.latence_ms)
+        self.stats["transactions"] += 1
+        self.stats["operations"] += len(lot)
+        for (_, future, _), (erreur, valeur) in zip(lot, resultats):
+            if erreur:
+                self.stats["operations_en_erreur"] += 1
+                future.set_exception(valeur)
+            else:
+                future.set_result(valeur)
+
+    def _transaction(self, lot):
+        """Exécute le lot dans une transaction ; retourne [(en_erreur, valeur)]"""
+        cursor = self._cursor
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            resultats = []
+            for operation, _, _ in lot:
+                cursor.execute("SAVEPOINT operation")
+                try:
+                    resultats.append((False, operation(cursor)))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO operation")
+                    resultats.append((True, e))
+                cursor.execute("RELEASE operation")
+            cursor.execute("COMMIT")
+        except Exception:
+            if cursor.connection.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+        return resultats